@@ -0,0 +1,147 @@
+import csv
+import multiprocessing
+import os
+import time
+import cv2
+import torch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from colorama import Fore, Style
+from config import BATCH_PROCESSING, DEVICE, PROFILING, QUALITY_ANALYSIS, STREAMING
+from quality_analyzer import initialize_quality_metrics
+from utils import disable_color, ensure_directory, print_header, print_success, print_warning
+
+STATUS_COLUMNS = ['movie_name', 'status', 'completion_timestamp', 'duration_seconds',
+                  'scenes_with_sequences', 'total_scenes', 'worker_pid', 'error']
+
+# Quality metrics loaded once per worker process and reused for every title
+_worker_metrics = None
+
+def limit_threads(num_threads):
+    """Cap the torch/OpenCV/codec thread pools so parallel workers don't oversubscribe cores
+    
+    torch.set_num_threads also sizes the OpenMP/MKL pools torch runs on; the OMP/MKL/OPENBLAS
+    environment variables would come too late here, as torch, numpy and cv2 are already loaded.
+    """
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only settable before the first parallel torch operation
+        pass
+    cv2.setNumThreads(num_threads)
+    if not STREAMING['decode_threads']:
+        STREAMING['decode_threads'] = num_threads
+
+def init_worker(num_threads, color_output=True):
+    """Set thread limits and colour output, and load the quality metrics once for this worker"""
+    global _worker_metrics
+    if not color_output:
+        # Spawned workers re-import the config, so the parent's setting is passed in
+        PROFILING['color_output'] = False
+        disable_color()
+    limit_threads(num_threads)
+    _worker_metrics = initialize_quality_metrics(DEVICE, use_musiq=QUALITY_ANALYSIS['use_musiq'])
+
+def process_movie(mxf_file_path, output_folder, should_abort=None):
+    """Run the analysis pipeline for one title and return its status record
+    
+    should_abort is passed on to the pipeline; a run it stops is reported as 'aborted'.
+    """
+    # Imported here because main imports this module
+    from main import PipelineAborted, process_mxf_complete_pipeline
+    
+    movie_name = os.path.splitext(os.path.basename(mxf_file_path))[0]
+    start_time = time.time()
+    status = {
+        'movie_name': movie_name,
+        'status': 'completed',
+        'scenes_with_sequences': 0,
+        'total_scenes': 0,
+        'worker_pid': os.getpid(),
+        'error': ''
+    }
+    
+    try:
+        analysis_data = process_mxf_complete_pipeline(mxf_file_path, output_folder, _worker_metrics, should_abort)
+        status['scenes_with_sequences'] = analysis_data['quality_analysis']['total_scenes_with_sequences']
+        status['total_scenes'] = analysis_data['scene_detection']['total_scenes_detected']
+    except PipelineAborted as e:
+        status['status'] = 'aborted'
+        status['error'] = str(e)
+    except Exception as e:
+        status['status'] = 'failed'
+        status['error'] = str(e)
+    
+    status['completion_timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    status['duration_seconds'] = round(time.time() - start_time, 1)
+    return status
+
+def append_status(status_path, status):
+    """Append one title's status to the consolidated processing report"""
+    ensure_directory(status_path)
+    write_header = not os.path.exists(status_path)
+    with open(status_path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=STATUS_COLUMNS)
+        if write_header:
+            writer.writeheader()
+        writer.writerow(status)
+
+def get_movies_to_process(mxf_folder, output_folder):
+    """List movie files whose analysis JSON does not exist yet"""
+    movies_to_process = []
+    for filename in sorted(os.listdir(mxf_folder)):
+        base_name = os.path.splitext(filename)[0]
+        expected_output_file = os.path.join(output_folder, f"{base_name}_analysis.json")
+        
+        if os.path.exists(expected_output_file):
+            print(f"{Fore.YELLOW}⏩ Skipping '{filename}': Analysis file already exists.{Style.RESET_ALL}")
+            continue
+        
+        movies_to_process.append(os.path.join(mxf_folder, filename))
+    return movies_to_process
+
+def run_batch(mxf_folder="movie", output_folder="analysis_results", num_workers=None):
+    """Analyze every pending movie, spreading titles over a pool of warm workers"""
+    num_workers = num_workers or BATCH_PROCESSING['workers']
+    threads_per_worker = BATCH_PROCESSING['threads_per_worker'] or max(1, os.cpu_count() // num_workers)
+    status_path = os.path.join(output_folder, BATCH_PROCESSING['status_file'])
+    
+    if not os.listdir(mxf_folder):
+        print(f"{Fore.YELLOW}No .mxf files found in the '{mxf_folder}' directory.{Style.RESET_ALL}")
+        return []
+    
+    movies_to_process = get_movies_to_process(mxf_folder, output_folder)
+    if not movies_to_process:
+        print_header("✅ ALL FILES PROCESSED")
+        return []
+    print(f"Found {len(movies_to_process)} MXF files to process "
+          f"({num_workers} workers x {threads_per_worker} threads).\n")
+    
+    statuses = []
+    if num_workers == 1:
+        init_worker(threads_per_worker)
+        for mxf_file_path in movies_to_process:
+            print(f"{Fore.CYAN}{'-'*80}{Style.RESET_ALL}")
+            status = process_movie(mxf_file_path, output_folder)
+            append_status(status_path, status)
+            statuses.append(status)
+    else:
+        # Spawned workers avoid sharing CUDA/OpenMP state with the parent
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                                 initializer=init_worker, initargs=(threads_per_worker, PROFILING['color_output'])) as executor:
+            futures = [executor.submit(process_movie, path, output_folder) for path in movies_to_process]
+            for future in as_completed(futures):
+                status = future.result()
+                append_status(status_path, status)
+                statuses.append(status)
+                if status['status'] == 'completed':
+                    print_success(f"{status['movie_name']} finished in {status['duration_seconds']}s")
+                else:
+                    print_warning(f"{status['movie_name']} failed: {status['error']}")
+    
+    failed = sum(1 for status in statuses if status['status'] != 'completed')
+    print_header(f"✅ ALL FILES PROCESSED ({len(statuses) - failed} completed, {failed} failed)")
+    print(f"{Fore.CYAN}📋 Status report: {Fore.YELLOW}{status_path}")
+    return statuses
@@ -0,0 +1,307 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import av
+import cv2
+import torch
+from colorama import Fore, Style
+from config import BENCHMARK, FRAME_EXTRACTION, OUTPUT, PREFILTER, QUALITY_ANALYSIS
+from data_exporter import save_analysis_json
+from frame_extractor import extract_selected_frames
+from frame_preprocessor import PrefilterCascade
+from profiling import get_peak_rss_bytes, stage_profiler
+from quality_analyzer import initialize_quality_metrics, find_sequence_per_scene, find_sequences_per_scene_niqe_only
+from scene_detector import find_and_split_scenes
+from utils import disable_color, print_header, print_info, print_success, print_warning
+from video_reader import read_mxf_video
+from benchmarks.synthetic_video import FIXTURES, get_fixture
+
+class Measurement:
+    """Times the measured part of a benchmark, leaving out setup such as model loading"""
+    
+    def __init__(self):
+        self.wall_seconds = None
+        self.cpu_seconds = None
+    
+    def __enter__(self):
+        stage_profiler.reset()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.wall_seconds = time.perf_counter() - self._wall
+        self.cpu_seconds = time.process_time() - self._cpu
+        return False
+
+def get_fixture_scenes(fixture):
+    """Build scene records at a fixture's known cuts, shaped like the scene detector's"""
+    boundaries = [0] + fixture['cuts'] + [fixture['total_frames']]
+    scenes_info = []
+    for scene_id, (start_frame, end_frame) in enumerate(zip(boundaries, boundaries[1:]), 1):
+        scenes_info.append({
+            'scene_id': scene_id,
+            'start_time_seconds': round(start_frame / fixture['frame_rate'], 2),
+            'end_time_seconds': round(end_frame / fixture['frame_rate'], 2),
+            'start_frame': start_frame,
+            'end_frame': end_frame,
+            'frame_count': end_frame - start_frame + 1
+        })
+    return scenes_info
+
+def bench_read_mxf_video(fixture, work_folder, measurement):
+    """Decode and convert every frame to 720p"""
+    with measurement:
+        frame_source, _video_info = read_mxf_video(fixture['path'])
+        try:
+            frames = sum(1 for _ in frame_source.iter_range(0))
+        finally:
+            frame_source.close()
+    return {'frames': frames}
+
+def bench_find_and_split_scenes(fixture, work_folder, measurement):
+    """Decode and detect scenes, checking the detected cuts against the known ones"""
+    with measurement:
+        frame_source, video_info = read_mxf_video(fixture['path'])
+        try:
+            scenes_info = find_and_split_scenes(frame_source, video_info['frame_rate'])
+        finally:
+            frame_source.close()
+    detected_cuts = [scene['start_frame'] for scene in scenes_info[1:]]
+    cuts_found = sum(1 for cut in fixture['cuts'] if any(abs(cut - detected) <= 1 for detected in detected_cuts))
+    return {
+        'frames': fixture['total_frames'],
+        'expected_cuts': fixture['cuts'],
+        'detected_cuts': detected_cuts,
+        'cuts_found': cuts_found
+    }
+
+def run_scoring_benchmark(fixture, measurement, use_musiq):
+    """Score the fixture's known scenes with NIQE (and MUSIQ) the way the pipeline does"""
+    try:
+        musiq_metric, niqe_metric, device = initialize_quality_metrics('cpu', use_musiq=use_musiq)
+    except Exception as e:
+        # Model weights are downloaded on first use; offline and uncached there is nothing to time
+        return {'skipped': f"quality models unavailable: {e}"}
+    
+    prefilter = PrefilterCascade(PREFILTER)
+    with measurement:
+        frame_source, _video_info = read_mxf_video(fixture['path'])
+        try:
+            scene_frames = frame_source.iter_scenes(get_fixture_scenes(fixture))
+            if use_musiq:
+                scene_results = find_sequence_per_scene(scene_frames, fixture['name'], musiq_metric, niqe_metric, device, None, None, prefilter)
+            else:
+                scene_results = find_sequences_per_scene_niqe_only(scene_frames, fixture['name'], niqe_metric, device, None, None, prefilter)
+        finally:
+            frame_source.close()
+    return {
+        'frames': fixture['total_frames'],
+        'metric_calls': stage_profiler.get_report()['counters'].get('metric_calls', 0),
+        'sequences_found': sum(1 for scene_result in scene_results if scene_result['sequence_found'])
+    }
+
+def bench_niqe_scoring(fixture, work_folder, measurement):
+    """NIQE-only scoring loop over every scene"""
+    return run_scoring_benchmark(fixture, measurement, use_musiq=False)
+
+def bench_musiq_scoring(fixture, work_folder, measurement):
+    """MUSIQ + NIQE scoring loop over every scene"""
+    return run_scoring_benchmark(fixture, measurement, use_musiq=True)
+
+def bench_frame_extraction(fixture, work_folder, measurement):
+    """Extract a fixed sequence from the middle of every scene, frame index build included"""
+    scenes_info = get_fixture_scenes(fixture)
+    sequence_length = QUALITY_ANALYSIS['sequence_length']
+    scene_results = []
+    for scene in scenes_info:
+        # Fixed selections stand in for the analysis, so the result does not depend on the models
+        first_frame = max((scene['start_frame'] + scene['end_frame'] - sequence_length) // 2, scene['start_frame'], 1)
+        selected_frames = list(range(first_frame, min(first_frame + sequence_length, scene['end_frame'] + 1)))
+        scene_results.append({
+            'scene_id': scene['scene_id'],
+            'sequence_found': True,
+            'selected_frames': selected_frames,
+            'total_frames_selected': len(selected_frames)
+        })
+    video_info = {'file_path': fixture['path'], 'frame_rate': fixture['frame_rate'], 'total_frames': fixture['total_frames']}
+    json_path = os.path.join(work_folder, f"{fixture['name']}_analysis.json")
+    save_analysis_json(video_info, scenes_info, scene_results, json_path)
+    
+    with measurement:
+        extract_selected_frames(json_path, os.path.join(work_folder, 'extracted'))
+    return {
+        'frames': sum(scene_result['total_frames_selected'] for scene_result in scene_results),
+        'mode': FRAME_EXTRACTION['mode'],
+        'output_format': FRAME_EXTRACTION['output_format']
+    }
+
+BENCHMARKS = {
+    'read_mxf_video': bench_read_mxf_video,
+    'find_and_split_scenes': bench_find_and_split_scenes,
+    'niqe_scoring': bench_niqe_scoring,
+    'musiq_scoring': bench_musiq_scoring,
+    'frame_extraction': bench_frame_extraction
+}
+
+def run_benchmark(name, fixture, color_output=True):
+    """Run one benchmark in this process (a fresh one, so peak RSS is its own)"""
+    if not color_output:
+        disable_color()
+    with tempfile.TemporaryDirectory() as work_folder:
+        # Frame indexes are built from scratch for every run
+        FRAME_EXTRACTION['index_folder'] = os.path.join(work_folder, 'frame_index')
+        measurement = Measurement()
+        result = BENCHMARKS[name](fixture, work_folder, measurement)
+    if 'skipped' in result:
+        return result
+    
+    report = stage_profiler.get_report()
+    result.update({
+        'wall_seconds': round(measurement.wall_seconds, 4),
+        'cpu_seconds': round(measurement.cpu_seconds, 4),
+        'frames_per_second': round(result['frames'] / measurement.wall_seconds, 2),
+        'peak_rss_bytes': get_peak_rss_bytes(),
+        'stages': {stage_name: {'wall_seconds': round(stage['wall_seconds'], 4), 'items_per_second': stage['items_per_second']}
+                   for stage_name, stage in report['stages'].items()}
+    })
+    return result
+
+def run_in_fresh_process(name, fixture, color_output):
+    """Run a benchmark in its own spawned process"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_benchmark, name, fixture, color_output).result()
+
+def get_environment():
+    """Describe the machine and library versions the numbers were taken with"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'python': platform.python_version(),
+        'av': av.__version__,
+        'opencv': cv2.__version__,
+        'torch': torch.__version__
+    }
+
+def run_suite(fixture_names, benchmark_names, repeats=BENCHMARK['repeats'], color_output=True):
+    """Run every benchmark on every fixture, keeping the fastest of the repeats"""
+    print_header("⏱️  PIPELINE BENCHMARKS")
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': get_environment(),
+        'fixtures': {},
+        'benchmarks': {}
+    }
+    for fixture_name in fixture_names:
+        fixture = get_fixture(fixture_name)
+        results['fixtures'][fixture_name] = {key: value for key, value in fixture.items() if key != 'path'}
+        for benchmark_name in benchmark_names:
+            key = f"{fixture_name}/{benchmark_name}"
+            print_info(f"Running {Fore.YELLOW}{key}")
+            runs = [run_in_fresh_process(benchmark_name, fixture, color_output) for _ in range(max(repeats, 1))]
+            timed_runs = [run for run in runs if 'skipped' not in run]
+            if not timed_runs:
+                print_warning(f"{key} skipped: {runs[0]['skipped']}")
+                results['benchmarks'][key] = runs[0]
+                continue
+            best = min(timed_runs, key=lambda run: run['wall_seconds'])
+            best['repeats'] = len(timed_runs)
+            results['benchmarks'][key] = best
+    return results
+
+def print_results(results):
+    """Print throughput and peak memory of every benchmark"""
+    print(f"\n{Fore.CYAN}{'benchmark':<32} {'frames':>7} {'seconds':>9} {'frames/s':>10} {'peak RSS':>10}")
+    for key, result in results['benchmarks'].items():
+        if 'skipped' in result:
+            print(f"{Fore.YELLOW}{key:<32} skipped")
+            continue
+        peak_rss = f"{result['peak_rss_bytes'] / 2**20:.0f} MiB" if result['peak_rss_bytes'] else 'n/a'
+        print(f"{Fore.WHITE}{key:<32} {result['frames']:>7} {result['wall_seconds']:>9.2f} {result['frames_per_second']:>10.2f} {peak_rss:>10}")
+        if 'cuts_found' in result:
+            print(f"{Fore.WHITE}{'':<32} cuts found {result['cuts_found']}/{len(result['expected_cuts'])} "
+                  f"(detected {len(result['detected_cuts'])})")
+    print(Style.RESET_ALL, end='')
+
+def save_results(results, save_as=None, results_folder=BENCHMARK['results_folder']):
+    """Save results as a JSON baseline"""
+    name = save_as or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    results_path = os.path.join(results_folder, f"{name}.json")
+    os.makedirs(results_folder, exist_ok=True)
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=OUTPUT['json_indent'])
+    print_success(f"Results saved to {Fore.YELLOW}{results_path}")
+    return results_path
+
+def compare_results(results, baseline, tolerance=BENCHMARK['regression_tolerance']):
+    """Print the change against a baseline; return the benchmarks that got slower or bigger beyond the tolerance"""
+    print_header(f"📊 COMPARISON WITH BASELINE ({baseline['created']}, commit {baseline['environment']['commit']})")
+    for fixture_name, fixture in results['fixtures'].items():
+        baseline_fixture = baseline['fixtures'].get(fixture_name)
+        if baseline_fixture is not None and baseline_fixture['fingerprint'] != fixture['fingerprint']:
+            print_warning(f"Fixture {fixture_name} was generated from a different recipe than the baseline's")
+    
+    regressions = []
+    print(f"{Fore.CYAN}{'benchmark':<32} {'frames/s':>10} {'baseline':>10} {'speed':>8} {'memory':>8}")
+    for key, result in results['benchmarks'].items():
+        baseline_result = baseline['benchmarks'].get(key)
+        if baseline_result is None or 'skipped' in result or 'skipped' in baseline_result:
+            continue
+        speed_ratio = result['frames_per_second'] / baseline_result['frames_per_second']
+        memory_ratio = None
+        if result['peak_rss_bytes'] and baseline_result['peak_rss_bytes']:
+            memory_ratio = result['peak_rss_bytes'] / baseline_result['peak_rss_bytes']
+        
+        regressed = speed_ratio < 1 - tolerance or (memory_ratio is not None and memory_ratio > 1 + tolerance)
+        if regressed:
+            regressions.append(key)
+        color = Fore.RED if regressed else Fore.GREEN if speed_ratio > 1 + tolerance else Fore.WHITE
+        memory = f"{memory_ratio:.2f}x" if memory_ratio is not None else 'n/a'
+        print(f"{color}{key:<32} {result['frames_per_second']:>10.2f} {baseline_result['frames_per_second']:>10.2f} "
+              f"{speed_ratio:>7.2f}x {memory:>8}")
+    print(Style.RESET_ALL, end='')
+    
+    if regressions:
+        print_warning(f"{len(regressions)} benchmarks regressed by more than {tolerance:.0%}: {', '.join(regressions)}")
+    else:
+        print_success(f"No regressions beyond {tolerance:.0%}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic fixtures (run from the repository root)")
+    parser.add_argument('--fixtures', nargs='+', choices=list(FIXTURES), default=BENCHMARK['fixtures'])
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=BENCHMARK['benchmarks'])
+    parser.add_argument('--repeats', type=int, default=BENCHMARK['repeats'], help="keep the fastest of this many runs")
+    parser.add_argument('--save-as', help="baseline name inside the results folder (default: timestamped)")
+    parser.add_argument('--compare', help="baseline JSON to compare against; exits with status 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK['regression_tolerance'])
+    parser.add_argument('--no-color', action='store_true', help="print without ANSI colours")
+    args = parser.parse_args()
+    if args.no_color:
+        disable_color()
+    
+    results = run_suite(args.fixtures, args.benchmarks, args.repeats, color_output=not args.no_color)
+    print_results(results)
+    save_results(results, args.save_as)
+    
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare_results(results, baseline, args.tolerance):
+            sys.exit(1)
\ No newline at end of file
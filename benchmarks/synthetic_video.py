@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import av
+import cv2
+import numpy as np
+from tqdm import tqdm
+from colorama import Fore
+from config import BENCHMARK, OUTPUT
+from utils import print_info, print_processing, print_success
+
+# Every fixture plays the same segments, each starting at a known cut
+SEGMENTS = [
+    {'kind': 'scene', 'frames': 50, 'blur_sigma': 0.0, 'noise_sigma': 0.0},
+    {'kind': 'blank', 'frames': 15},
+    {'kind': 'scene', 'frames': 40, 'blur_sigma': 2.5, 'noise_sigma': 0.0},
+    {'kind': 'scene', 'frames': 40, 'blur_sigma': 0.0, 'noise_sigma': 8.0},
+    {'kind': 'scene', 'frames': 50, 'blur_sigma': 0.0, 'noise_sigma': 0.0},
+    {'kind': 'scene', 'frames': 40, 'blur_sigma': 1.5, 'noise_sigma': 4.0}
+]
+
+# MXF/MPEG-2 as delivered for the 720p case, H.264 MP4 for 4K input
+FIXTURES = {
+    '720p': {'width': 1280, 'height': 720, 'container': 'mxf', 'codec': 'mpeg2video', 'bit_rate': 50000000, 'options': {}},
+    '4k': {'width': 3840, 'height': 2160, 'container': 'mp4', 'codec': 'libx264', 'bit_rate': 0, 'options': {'crf': '18', 'preset': 'veryfast'}}
+}
+
+def get_fixture_recipe(name):
+    """Everything that determines a fixture's content"""
+    return {'fixture': FIXTURES[name], 'segments': SEGMENTS, 'frame_rate': BENCHMARK['frame_rate'], 'seed': BENCHMARK['seed']}
+
+def get_fixture_fingerprint(name):
+    """Hash a fixture's recipe so a changed recipe regenerates it"""
+    recipe = json.dumps(get_fixture_recipe(name), sort_keys=True)
+    return hashlib.sha1(recipe.encode('utf-8')).hexdigest()
+
+class SyntheticScene:
+    """Deterministic moving content for one scene: smooth colour field, drifting texture and a moving box"""
+    
+    def __init__(self, rng, width, height, frames, blur_sigma=0.0, noise_sigma=0.0):
+        self.width = width
+        self.height = height
+        self.blur_sigma = blur_sigma
+        self.noise_sigma = noise_sigma
+        self.rng = rng
+        
+        # Motion in pixels per frame, scaled with the resolution
+        scale = width / 1280
+        self.velocity = rng.uniform(-3.0, 3.0, size=2) * scale
+        margin = int(np.ceil(np.abs(self.velocity).max() * frames)) + 1
+        self.margin = margin
+        
+        palette = (rng.random((5, 9, 3)) * 180 + 40).astype(np.float32)
+        self.palette = cv2.resize(palette, (width, height), interpolation=cv2.INTER_CUBIC)
+        texture = rng.normal(0.0, 30.0, ((height + 2 * margin) // 4 + 1, (width + 2 * margin) // 4 + 1)).astype(np.float32)
+        self.texture = cv2.resize(texture, (width + 2 * margin, height + 2 * margin), interpolation=cv2.INTER_LINEAR)
+        
+        self.box_size = (int(rng.integers(width // 10, width // 5)), int(rng.integers(height // 10, height // 5)))
+        self.box_start = rng.uniform(0.1, 0.6, size=2) * (width, height)
+        self.box_color = tuple(float(value) for value in rng.uniform(0, 255, size=3))
+    
+    def render(self, position):
+        """Render the scene's frame at a position as 8-bit RGB"""
+        offset_x = int(round(self.margin + self.velocity[0] * position))
+        offset_y = int(round(self.margin + self.velocity[1] * position))
+        texture = self.texture[offset_y:offset_y + self.height, offset_x:offset_x + self.width]
+        frame = self.palette + texture[..., None]
+        
+        box_x = int(self.box_start[0] - self.velocity[0] * position * 2) % self.width
+        box_y = int(self.box_start[1] - self.velocity[1] * position * 2) % self.height
+        cv2.rectangle(frame, (box_x, box_y), (box_x + self.box_size[0], box_y + self.box_size[1]), self.box_color, -1)
+        
+        if self.blur_sigma:
+            frame = cv2.GaussianBlur(frame, (0, 0), self.blur_sigma)
+        if self.noise_sigma:
+            frame += self.rng.standard_normal(frame.shape, dtype=np.float32) * self.noise_sigma
+        return np.clip(frame, 0, 255).astype(np.uint8)
+
+def iter_fixture_frames(name):
+    """Yield every frame of a fixture in order"""
+    fixture = FIXTURES[name]
+    rng = np.random.default_rng(BENCHMARK['seed'])
+    for segment in SEGMENTS:
+        if segment['kind'] == 'blank':
+            blank = np.zeros((fixture['height'], fixture['width'], 3), dtype=np.uint8)
+            for _ in range(segment['frames']):
+                yield blank
+            continue
+        scene = SyntheticScene(rng, fixture['width'], fixture['height'], segment['frames'],
+                               segment['blur_sigma'], segment['noise_sigma'])
+        for position in range(segment['frames']):
+            yield scene.render(position)
+
+def write_fixture_video(name, video_path):
+    """Encode a fixture with PyAV, writing to a temporary file first"""
+    fixture = FIXTURES[name]
+    total_frames = sum(segment['frames'] for segment in SEGMENTS)
+    temp_path = f"{video_path}.tmp.{fixture['container']}"
+    
+    container = av.open(temp_path, 'w', format=fixture['container'])
+    try:
+        stream = container.add_stream(fixture['codec'], rate=BENCHMARK['frame_rate'], options=fixture['options'])
+        stream.width = fixture['width']
+        stream.height = fixture['height']
+        stream.pix_fmt = 'yuv420p'
+        if fixture['bit_rate']:
+            stream.bit_rate = fixture['bit_rate']
+        # A keyframe every second keeps seeking costs realistic
+        stream.codec_context.gop_size = BENCHMARK['frame_rate']
+        
+        for frame_array in tqdm(iter_fixture_frames(name), total=total_frames, desc=f"Encoding {name}", unit="frame", colour="blue"):
+            frame = av.VideoFrame.from_ndarray(frame_array, format='rgb24')
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    finally:
+        container.close()
+    os.replace(temp_path, video_path)
+
+def get_fixture(name, fixture_folder=BENCHMARK['fixture_folder']):
+    """Get a fixture's manifest (path, size, known cuts), generating the video if it is missing or outdated"""
+    fixture = FIXTURES[name]
+    video_path = os.path.join(fixture_folder, f"synthetic_{name}.{fixture['container']}")
+    manifest_path = os.path.join(fixture_folder, f"synthetic_{name}.json")
+    fingerprint = get_fixture_fingerprint(name)
+    
+    if os.path.exists(manifest_path) and os.path.exists(video_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest['fingerprint'] == fingerprint:
+            print_info(f"Using fixture {Fore.YELLOW}{video_path}")
+            return manifest
+    
+    print_processing(f"Generating {name} fixture ({fixture['width']}x{fixture['height']} {fixture['codec']} in {fixture['container']})...")
+    os.makedirs(fixture_folder, exist_ok=True)
+    write_fixture_video(name, video_path)
+    
+    segments = []
+    start_frame = 0
+    for segment in SEGMENTS:
+        segments.append(dict(segment, start_frame=start_frame))
+        start_frame += segment['frames']
+    manifest = {
+        'name': name,
+        'path': video_path,
+        'width': fixture['width'],
+        'height': fixture['height'],
+        'container': fixture['container'],
+        'codec': fixture['codec'],
+        'frame_rate': BENCHMARK['frame_rate'],
+        'total_frames': start_frame,
+        'segments': segments,
+        # 0-based index of the first frame of every segment after the first, as the scene detector reports cuts
+        'cuts': [segment['start_frame'] for segment in segments[1:]],
+        'fingerprint': fingerprint
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=OUTPUT['json_indent'])
+    print_success(f"Fixture written to {Fore.YELLOW}{video_path}")
+    return manifest
\ No newline at end of file
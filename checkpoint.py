@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+from colorama import Fore
+from config import PREFILTER, QUALITY_ANALYSIS, SCENE_DETECTION, VIDEO_CONVERSION
+from threaded_pipeline import SceneResultWriter
+from utils import print_info, print_warning
+
+def get_checkpoint_path(output_folder, base_video_name):
+    """Get the path of the per-movie checkpoint journal"""
+    return os.path.join(output_folder, f"{base_video_name}_checkpoint.jsonl")
+
+def get_run_fingerprint(video_path):
+    """Identify the input file and the settings that scene results depend on"""
+    file_stat = os.stat(video_path)
+    settings = json.dumps([VIDEO_CONVERSION, SCENE_DETECTION, QUALITY_ANALYSIS, PREFILTER], sort_keys=True)
+    return {
+        'file_size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'settings': hashlib.sha1(settings.encode('utf-8')).hexdigest()
+    }
+
+def read_journal_lines(checkpoint_path):
+    """Read complete JSON lines, cutting off a line torn by a crash mid-write"""
+    with open(checkpoint_path, 'rb') as f:
+        content = f.read()
+    complete_length = content.rfind(b'\n') + 1
+    if complete_length < len(content):
+        os.truncate(checkpoint_path, complete_length)
+    return [json.loads(line) for line in content[:complete_length].splitlines() if line.strip()]
+
+class CheckpointJournal:
+    """Append-only record of finished scenes with their results and scores, used to resume a crashed run"""
+    
+    def __init__(self, checkpoint_path, video_path, score_store=None, prefilter=None):
+        self.checkpoint_path = checkpoint_path
+        self.fingerprint = get_run_fingerprint(video_path)
+        self.score_store = score_store
+        self.prefilter = prefilter
+        self._writer = None
+        self._pending_result = None
+        self._score_position = 0
+    
+    def resume(self):
+        """Restore the finished scenes of an earlier run and open the journal for appending
+        
+        Returns the journal entries of the finished scenes; a journal written for another
+        file or other settings is discarded.
+        """
+        entries = []
+        if os.path.exists(self.checkpoint_path):
+            lines = read_journal_lines(self.checkpoint_path)
+            if lines and lines[0].get('fingerprint') == self.fingerprint:
+                entries = [line for line in lines[1:] if line.get('type') == 'scene']
+            else:
+                print_warning(f"Checkpoint {os.path.basename(self.checkpoint_path)} is from another file or settings; starting over")
+        
+        if entries:
+            for entry in entries:
+                if self.score_store is not None and entry['scores'] is not None:
+                    self.score_store.add_records(entry['scores'])
+            if self.prefilter is not None and entries[-1]['prefilter'] is not None:
+                self.prefilter.restore_stats(entries[-1]['prefilter'])
+            print_info(f"Resuming from checkpoint: {Fore.YELLOW}{len(entries)}{Fore.BLUE} scenes already finished")
+            self._writer = SceneResultWriter(self.checkpoint_path, mode='a')
+        else:
+            self._writer = SceneResultWriter(self.checkpoint_path, mode='w')
+            self._writer.submit({'type': 'header', 'fingerprint': self.fingerprint})
+        
+        self._score_position = len(self.score_store) if self.score_store is not None else 0
+        return entries
+    
+    def record_result(self, scene_result):
+        """Hold a scene's result until the scene detector confirms where that scene ends"""
+        self._pending_result = scene_result
+    
+    def record_scene(self, scene):
+        """Append a finished scene with its result and the scores recorded since the previous scene"""
+        if self._pending_result is None:
+            return
+        scores = None
+        if self.score_store is not None:
+            scores = self.score_store.get_records(self._score_position)
+            self._score_position = len(self.score_store)
+        self._writer.submit({
+            'type': 'scene',
+            'scene': dict(scene),
+            'result': self._pending_result,
+            'scores': scores,
+            'prefilter': self.prefilter.get_stats() if self.prefilter is not None else None
+        })
+        self._pending_result = None
+    
+    def close(self):
+        """Flush the remaining entries and close the journal"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
\ No newline at end of file
@@ -0,0 +1,177 @@
+import json
+import os
+import av
+import numpy as np
+from colorama import Fore, Style
+from config import CLIP_EXPORT, OUTPUT
+from frame_writer import PARTIAL_TAG
+from profiling import stage_profiler
+from utils import print_header, print_processing, print_success, print_warning
+from video_reader import load_frame_index
+
+# Codecs the MP4 muxer accepts; anything else (ProRes, DNxHD, ...) is written to the fallback container
+MP4_CODECS = {'h264', 'hevc', 'mpeg4', 'mpeg2video', 'mpeg1video', 'av1', 'vp9', 'mjpeg'}
+
+def load_scenes_to_clip(json_path, scene_selection=None):
+    """Get the video path and the scenes of an analysis JSON to cut into clips"""
+    scene_selection = scene_selection or CLIP_EXPORT['scenes']
+    with open(json_path, 'r') as f:
+        analysis_data = json.load(f)
+    
+    scenes = analysis_data['scene_detection']['scenes']
+    if scene_selection == 'selected':
+        scenes = [scene for scene in scenes if scene['frames_selected']]
+    return analysis_data['video_information']['file_path'], scenes
+
+def get_clip_container(codec_name):
+    return CLIP_EXPORT['container'] if CLIP_EXPORT['container'] != 'mp4' or codec_name in MP4_CODECS else CLIP_EXPORT['fallback_container']
+
+def get_clip_path(output_folder, movie_name, scene_id, container_format):
+    return os.path.join(output_folder, f"{movie_name}-Scene-{scene_id:03d}.{container_format}")
+
+def snap_to_keyframe(keyframe_positions, start_position, end_position):
+    """Get the keyframe a stream-copied clip of [start_position, end_position) has to start on, or None"""
+    if CLIP_EXPORT['keyframe_snap'] == 'after':
+        # Start late rather than include frames of the previous scene
+        slot = np.searchsorted(keyframe_positions, start_position, side='left')
+        if slot == len(keyframe_positions) or keyframe_positions[slot] >= end_position:
+            return None
+        return int(keyframe_positions[slot])
+    slot = np.searchsorted(keyframe_positions, start_position, side='right') - 1
+    return int(keyframe_positions[slot]) if slot >= 0 else 0
+
+def remux_clip(container, video_stream, clip_path, container_format, pts_values, start_position, last_position):
+    """Copy the packets from the keyframe at start_position through the frame at last_position into a new file
+    
+    Packets are taken in decode order until the copied frames run without a gap from the
+    keyframe through the last frame. With B-frames this takes a few reference frames past
+    the scene end along with the frames between them, so the clip shows no holes; the
+    sorted frame positions copied are returned.
+    """
+    start_pts = int(pts_values[start_position])
+    container.seek(start_pts, stream=video_stream, backward=True, any_frame=False)
+    output = av.open(clip_path + PARTIAL_TAG, 'w', format=container_format)
+    try:
+        clip_stream = output.add_stream_from_template(video_stream)
+        copied_positions = set()
+        started = False
+        for packet in container.demux(video_stream):
+            if packet.pts is None and packet.dts is None:
+                # Flush packet at the end of the stream
+                continue
+            started = started or (packet.is_keyframe and packet.pts is not None and packet.pts >= start_pts)
+            if not started:
+                continue
+            # Leading frames of an open GOP reference the previous GOP, which the clip lacks
+            if packet.pts is not None and packet.pts < start_pts:
+                continue
+            
+            if packet.pts is not None:
+                copied_positions.add(int(np.searchsorted(pts_values, packet.pts)))
+            packet.pts = packet.pts - start_pts if packet.pts is not None else None
+            packet.dts = packet.dts - start_pts if packet.dts is not None else None
+            packet.stream = clip_stream
+            output.mux(packet)
+            
+            last_copied = max(copied_positions, default=start_position)
+            if last_copied >= last_position and len(copied_positions) == last_copied - start_position + 1:
+                break
+    finally:
+        output.close()
+    os.replace(clip_path + PARTIAL_TAG, clip_path)
+    return sorted(copied_positions)
+
+def export_movie_clips(json_path, output_folder, scene_selection=None):
+    """Cut the scenes of one analysis JSON into separate files by stream copy, without decoding"""
+    video_path, scenes = load_scenes_to_clip(json_path, scene_selection)
+    movie_name = os.path.basename(json_path)[:-len('_analysis.json')]
+    if not scenes:
+        print_warning(f"No scenes to clip in {os.path.basename(json_path)}")
+        return []
+    
+    frame_index = load_frame_index(video_path)
+    pts_values = frame_index['pts']
+    keyframe_positions = np.flatnonzero(frame_index['keyframe'])
+    os.makedirs(output_folder, exist_ok=True)
+    
+    container = av.open(video_path)
+    video_stream = container.streams.video[0]
+    container_format = get_clip_container(video_stream.codec_context.name)
+    clips = []
+    try:
+        for scene in scenes:
+            end_position = min(scene['end_frame'], len(pts_values))
+            start_position = snap_to_keyframe(keyframe_positions, scene['start_frame'], end_position)
+            if start_position is None or start_position >= end_position:
+                print_warning(f"Scene {scene['scene_id']} has no keyframe to cut at; skipped")
+                continue
+            
+            clip_path = get_clip_path(output_folder, movie_name, scene['scene_id'], container_format)
+            with stage_profiler.stage('clip_remux', items=end_position - start_position):
+                copied_positions = remux_clip(container, video_stream, clip_path, container_format,
+                                              pts_values, start_position, end_position - 1)
+            
+            # Frame numbers (1-based) the clip actually shows, including keyframe pre-roll and
+            # the reference frames past the scene end that its last frames depend on
+            clips.append({
+                'scene_id': scene['scene_id'],
+                'file': os.path.basename(clip_path),
+                'scene_start_frame': scene['start_frame'] + 1,
+                'scene_end_frame': end_position,
+                'clip_start_frame': copied_positions[0] + 1 if copied_positions else None,
+                'clip_end_frame': copied_positions[-1] + 1 if copied_positions else None,
+                'clip_frames': len(copied_positions)
+            })
+            print(f"{Fore.CYAN}  Scene {scene['scene_id']}: {clips[-1]['file']} ({len(copied_positions)} frames)")
+    finally:
+        container.close()
+    return clips
+
+def save_clip_manifest(output_folder, json_path, clips):
+    """Write the manifest of a movie's clips; it is written last, so it marks a complete export"""
+    manifest = {
+        'analysis_json': os.path.basename(json_path),
+        'scene_selection': CLIP_EXPORT['scenes'],
+        'keyframe_snap': CLIP_EXPORT['keyframe_snap'],
+        'total_clips': len(clips),
+        'clips': clips
+    }
+    manifest_path = os.path.join(output_folder, CLIP_EXPORT['manifest_file'])
+    with open(manifest_path + PARTIAL_TAG, 'w') as f:
+        json.dump(manifest, f, indent=OUTPUT['json_indent'])
+    os.replace(manifest_path + PARTIAL_TAG, manifest_path)
+    return manifest_path
+
+def export_scene_clips(analysis_results_folder="analysis_results", clips_folder=None, scene_selection=None):
+    """Export the scenes of every analysed movie as stream-copied clips, one folder per movie"""
+    clips_folder = clips_folder or CLIP_EXPORT['output_folder']
+    print_header("🎞️ SCENE CLIP EXPORT")
+    
+    json_files = sorted(f for f in os.listdir(analysis_results_folder) if f.endswith('_analysis.json'))
+    if not json_files:
+        print_warning(f"No analysis JSON files found in '{analysis_results_folder}'")
+        return 0
+    
+    total_clips = 0
+    for json_file in json_files:
+        movie_name = json_file[:-len('_analysis.json')]
+        movie_output_folder = os.path.join(clips_folder, movie_name)
+        if os.path.exists(os.path.join(movie_output_folder, CLIP_EXPORT['manifest_file'])):
+            print(f"{Fore.YELLOW}⏩ Skipping '{json_file}': clips already exported{Style.RESET_ALL}")
+            continue
+        
+        print_processing(f"Cutting scene clips from {json_file}")
+        json_path = os.path.join(analysis_results_folder, json_file)
+        try:
+            clips = export_movie_clips(json_path, movie_output_folder, scene_selection)
+        except (OSError, av.FFmpegError) as e:
+            print(f"{Fore.RED}❌ Error processing {json_file}: {str(e)}")
+            continue
+        save_clip_manifest(movie_output_folder, json_path, clips)
+        total_clips += len(clips)
+    
+    print_success(f"Exported {total_clips} scene clips to: {Fore.YELLOW}{clips_folder}")
+    return total_clips
+
+if __name__ == "__main__":
+    export_scene_clips("analysis_results", CLIP_EXPORT['output_folder'])
\ No newline at end of file
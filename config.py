@@ -7,9 +7,43 @@ VIDEO_CONVERSION = {
     'format': 'yuv420p'
 }
 
+# Frame streaming settings
+STREAMING = {
+    'buffer_frames': 16,  # Decoded frames kept for look-back; bounds decode memory
+    'decode_threads': 0,  # Codec threads per decoder; 0 uses the worker's thread budget (every core outside a pool)
+    'decode_thread_type': 'AUTO',  # 'AUTO' (frame and slice threading), 'FRAME', 'SLICE', or 'NONE' for single-threaded decoding
+    'scaler': 'filter_graph',  # 'filter_graph' scales and converts in one reused FFmpeg filter graph; 'reformat' reuses one swscale context
+    'frame_pool_frames': None  # Ring of preallocated 720p frames reused in place (~1.4 MB each); None sizes it to the
+                               # frames the buffers below can hold, 0 allocates every frame
+}
+
+# Pipeline execution settings
+PIPELINE = {
+    'mode': 'threaded',  # 'threaded' overlaps decode, scoring and result writing; 'sequential' runs them in turn;
+                         # 'scene_parallel' detects scenes first, then scores scene ranges on a process pool
+    'decode_queue_frames': 32,  # Decoded frames queued ahead of scoring
+    'result_queue_size': 64,  # Finished scene results queued for the writer
+    'scene_workers': None,  # Processes for 'scene_parallel'; None uses every CPU core
+    'scene_chunks_per_worker': 4  # Contiguous scene ranges per worker, for load balancing
+}
+
 # Scene detection settings
 SCENE_DETECTION = {
-    'adaptive_threshold': 3.0
+    'adaptive_threshold': 3.0,
+    'window_width': 2,  # Frames either side of a cut; cuts are confirmed this many frames late
+    'detection_width': 256,  # Width of the luma proxy the detector analyses
+    'proxy_frame_step': 1,  # Run the detector on every n-th proxy frame only; cuts are still placed on the exact frame
+    'proxy_cache_folder': None  # Keep each movie's luma proxy here so detection can be re-tuned without decoding
+                                # (roughly 37 KB per frame at 256 px wide); None disables the cache
+}
+
+# Detected scene lists, reused when the same file is analysed again with the same detector settings
+SCENE_CACHE = {
+    'enabled': True,
+    'cache_folder': 'scene_cache',  # Local disk; one small JSON file per movie and setting combination
+    'max_bytes': 64 * 1024**2,  # Least recently used lists are evicted beyond this
+    'sample_blocks': 16,  # Blocks hashed across the file for its fingerprint, with its size and mtime
+    'block_size': 64 * 1024
 }
 
 # Quality analysis settings
@@ -18,7 +52,98 @@ QUALITY_ANALYSIS = {
     'use_musiq': False,  # Set to False to use NIQE-only
     'musiq_threshold': 35.0,
     'niqe_threshold': 6.0,
-    'min_frame_variance': 10.0
+    'min_frame_variance': 10.0,
+    'batch_size': 8,  # Frames scored per metric call
+    'search_strategy': 'exhaustive'  # 'exhaustive' scores every frame in order; 'coarse_to_fine' probes one frame per window first
+}
+
+# Near-duplicate scenes across movies (other versions, trailers, re-edits) found by perceptual hashes
+SCENE_DEDUP = {
+    'enabled': False,
+    'index_folder': 'scene_index',  # One compact .npz of scene hashes per analysed movie
+    'thumbnails': 4,  # Thumbnails hashed per scene, spread over its first frames
+    'hash_window_frames': 16,  # Scene frames the thumbnails are taken from; held back until the scene is matched
+    'max_hamming_distance': 6,  # Of 64 bits, for every thumbnail of a scene; re-encodes stay within a few bits
+    'on_match': 'skip'  # 'skip' selects nothing in a duplicate scene; 'reuse' copies the matched scene's selection
+}
+
+# Cheap pre-filter cascade run on downscaled luma before NIQE/MUSIQ (None disables a stage)
+PREFILTER = {
+    'enabled': False,
+    'luma_downscale': 4,  # Box-downscale factor for the luma plane
+    'clip_low': 16,  # Luma at or below this counts as crushed
+    'clip_high': 235,  # Luma at or above this counts as blown out
+    'max_clipped_ratio': 0.6,
+    'min_sharpness': 10.0,  # Laplacian variance of the downscaled luma
+    'max_blockiness': None,  # Ratio of 8x8 grid steps to all steps (luma_downscale must be 1, 2 or 4)
+    'max_banding': None  # Share of flat steps among smooth transitions, on the downscaled luma
+}
+
+# Per-frame score store settings
+SCORE_STORE = {
+    'enabled': True,
+    'file_suffix': '_scores.npz',
+    'score_full_scenes': False  # Keep scoring after a sequence is found so any threshold can be re-selected
+}
+
+# Full-resolution frames of the selected sequences, cached during analysis for extraction and dataset export
+FRAME_CACHE = {
+    'enabled': False,  # Analysis then holds its last ~80 decoded frames at source resolution in memory
+    'cache_folder': 'frame_cache',  # Local disk; one folder of memmappable .npy sequences per movie
+    'max_bytes': 200 * 1024**3,  # Least recently used movies are evicted beyond this
+    'index_file': '_frame_cache.json'  # Written into a movie folder once its analysis is complete
+}
+
+# Frame extraction settings
+FRAME_EXTRACTION = {
+    'mode': 'seek',  # 'seek' decodes only the selected runs; 'sequential' decodes the whole video
+    'index_folder': 'frame_index',  # Persisted frame number -> PTS/keyframe indexes
+    'output_format': 'png',  # 'png' (16-bit), 'tiff' (uncompressed 16-bit) or 'npy' (raw array)
+    'png_compression': 3,  # zlib level 0-9; lower is faster and larger
+    'writer_workers': 4,  # Frames encoded and written concurrently
+    'writer_backend': 'thread',  # 'thread' or 'process'
+    'completion_marker': '_extraction_complete.json'  # Written into a movie folder once all its frames exist
+}
+
+# LR counterparts generated for each selected sequence during extraction/export
+DEGRADATION = {
+    'enabled': False,
+    'scales': [4],  # Downscale factors
+    'kernels': ['bicubic'],  # 'bicubic', 'bilinear', 'area' or 'nearest'; one LR set per scale and kernel
+    'noise_sigma': 0.0,  # Gaussian noise std as a fraction of full scale (0 disables)
+    'jpeg_quality': None,  # JPEG round-trip quality 1-100 (None disables)
+    'device': 'auto'
+}
+
+# Training dataset export settings
+DATASET_EXPORT = {
+    'format': 'tar',  # 'tar' shards of .npy samples or one flat 'memmap' uint16 array
+    'shard_max_bytes': 2 * 1024 ** 3,  # A new shard starts once the next sample would exceed this
+    'array_file': 'frames.u16',  # Flat array file used by the 'memmap' format
+    'manifest_file': 'manifest.json'
+}
+
+# Stage timing reports and console output
+PROFILING = {
+    'enabled': True,  # Per-stage wall/CPU time, frames/s, metric calls and peak RSS per movie
+    'report_folder': 'profiles',  # Inside the output folder, apart from the analysis JSON files
+    'report_suffix': '_profile.json',
+    'prometheus_textfile_dir': None,  # node_exporter textfile collector directory (None disables)
+    'cprofile_file': 'run_profile.pstats',  # --profile output, inside the output folder
+    'profile_summary_file': 'run_profile.txt',
+    'color_output': True  # False (or --no-color) prints plain text, which is cheaper in batch logs
+}
+
+# Benchmark suite settings (python -m benchmarks.run_benchmarks)
+BENCHMARK = {
+    'fixture_folder': 'benchmarks/fixtures',  # Generated synthetic videos, reused while their recipe is unchanged
+    'results_folder': 'benchmarks/results',  # Saved baselines
+    'fixtures': ['720p', '4k'],
+    'benchmarks': ['read_mxf_video', 'find_and_split_scenes', 'niqe_scoring', 'frame_extraction'],  # 'musiq_scoring' is also available
+    'frame_rate': 25,
+    'seed': 1234,
+    'repeats': 1,  # Best of this many runs, each in a fresh process
+    'regression_tolerance': 0.10  # Fractional slowdown or peak memory growth that fails a comparison
 }
 
 # Output settings
@@ -26,5 +151,32 @@ OUTPUT = {
     'json_indent': 2
 }
 
+# Scene clip export settings (clips are cut by stream copy, without decoding or re-encoding)
+CLIP_EXPORT = {
+    'scenes': 'selected',  # 'selected' clips only scenes with a selected sequence; 'all' clips every scene
+    'output_folder': 'scene_clips',  # One folder per movie with <movie>-Scene-NNN files
+    'container': 'mp4',
+    'fallback_container': 'mov',  # For codecs MP4 cannot carry, e.g. ProRes or DNxHD masters
+    'keyframe_snap': 'before',  # Clips must start on a keyframe: 'before' keeps the whole scene with some pre-roll,
+                                # 'after' drops the scene's frames before its first keyframe
+    'manifest_file': '_clips.json'  # Written into a movie folder once all its clips exist
+}
+
+# Multi-movie batch settings
+BATCH_PROCESSING = {
+    'workers': 1,  # Movies analysed in parallel, each worker keeps its models loaded
+    'threads_per_worker': None,  # torch/OpenCV threads per worker; None splits the CPU cores evenly
+    'status_file': 'movie_processing_status.csv'
+}
+
+# Coordinator-free work queue for several workers/nodes sharing movie/ and analysis_results/
+WORK_QUEUE = {
+    'enabled': False,  # main.py runs one lease-based worker instead of the local batch
+    'lease_folder': 'leases',  # Inside the output folder
+    'lease_timeout_seconds': 300,  # A lease without a heartbeat for this long is reclaimed
+    'heartbeat_seconds': 30,
+    'poll_seconds': 10  # Wait between scans while other workers hold every remaining movie
+}
+
 # Device settings
 DEVICE = 'auto'  # 'auto', 'cuda', or 'cpu'
\ No newline at end of file
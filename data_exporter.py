@@ -1,9 +1,11 @@
 import json
+import os
 from colorama import Fore
 from config import OUTPUT
+from profiling import stage_profiler
 from utils import ensure_directory, print_processing, print_success
 
-def save_analysis_json(video_info, scenes_info, scene_results, output_path):
+def save_analysis_json(video_info, scenes_info, scene_results, output_path, prefilter_stats=None):
     """Save complete analysis results to JSON file"""
     print_processing("Preparing analysis data for export...")
     
@@ -43,11 +45,15 @@ def save_analysis_json(video_info, scenes_info, scene_results, output_path):
             'scene_results': scene_results
         }
     }
+    if prefilter_stats is not None:
+        analysis_data['quality_analysis']['prefilter'] = prefilter_stats
     
-    # Save to JSON file
+    # Save to JSON file (written aside and renamed, as it may replace the only copy)
     ensure_directory(output_path)
-    with open(output_path, 'w') as f:
-        json.dump(analysis_data, f, indent=OUTPUT['json_indent'])
+    with stage_profiler.stage('json_export'):
+        with open(output_path + '.tmp', 'w') as f:
+            json.dump(analysis_data, f, indent=OUTPUT['json_indent'])
+        os.replace(output_path + '.tmp', output_path)
     
     print_success(f"Analysis data saved to: {Fore.YELLOW}{output_path}")
     return analysis_data
\ No newline at end of file
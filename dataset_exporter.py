@@ -0,0 +1,218 @@
+import io
+import json
+import os
+import re
+import tarfile
+import numpy as np
+from colorama import Fore, Style
+from config import DATASET_EXPORT, DEGRADATION, OUTPUT
+from degradation import SequenceDegrader
+from frame_extractor import iter_selected_sequences, load_analysis_json
+from frame_writer import PARTIAL_TAG
+from utils import print_header, print_processing, print_success, print_warning
+
+TAR_BLOCK_SIZE = 512
+
+def make_npy_header(array):
+    """Get the .npy header bytes that precede the raw data of an array"""
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(array))
+    return header.getvalue()
+
+def make_sample_key(movie_name, scene_id):
+    """Build a sample key without dots or spaces, which shard readers treat as separators"""
+    return f"{re.sub(r'[^A-Za-z0-9_-]+', '_', movie_name)}_scene{scene_id:04d}"
+
+class _SampleReader:
+    """File-like view over an .npy header and an array buffer, so tarfile streams the sample without copying it"""
+    
+    def __init__(self, header, array):
+        self._parts = [memoryview(header), memoryview(array).cast('B')]
+    
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and size != 0:
+            part = self._parts[0]
+            take = len(part) if size < 0 else min(size, len(part))
+            chunks.append(part[:take])
+            self._parts[0] = part[take:]
+            if not len(self._parts[0]):
+                self._parts.pop(0)
+            if size > 0:
+                size -= take
+        return b''.join(chunks)
+
+class TarShardWriter:
+    """Write samples as uncompressed .npy members into sequential tar shards of bounded size"""
+    
+    def __init__(self, dataset_folder, shard_max_bytes=DATASET_EXPORT['shard_max_bytes']):
+        self.dataset_folder = dataset_folder
+        self.shard_max_bytes = shard_max_bytes
+        self.shard_count = 0
+        self._tar = None
+        self._shard_name = None
+    
+    def add(self, sample_key, arrays, metadata):
+        """Append one sample's arrays and return where each array's data starts inside the shard"""
+        headers = {name: make_npy_header(array) for name, array in arrays.items()}
+        sample_size = sum(len(headers[name]) + array.nbytes for name, array in arrays.items())
+        if self._tar is None or (self._tar.offset and self._tar.offset + sample_size > self.shard_max_bytes):
+            self._open_next_shard()
+        
+        locations = {}
+        for name, array in arrays.items():
+            member = tarfile.TarInfo(f"{sample_key}.{name}.npy")
+            member.size = len(headers[name]) + array.nbytes
+            self._tar.addfile(member, _SampleReader(headers[name], array))
+            
+            # Member data is padded to whole blocks, so its start follows from the end offset
+            padded_size = -(-member.size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+            data_offset = self._tar.offset - padded_size + len(headers[name])
+            locations[name] = {'shard': self._shard_name, 'member': member.name, 'data_offset': data_offset}
+        
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        metadata_member = tarfile.TarInfo(f"{sample_key}.json")
+        metadata_member.size = len(metadata_bytes)
+        self._tar.addfile(metadata_member, io.BytesIO(metadata_bytes))
+        return locations
+    
+    def _open_next_shard(self):
+        """Finish the current shard and start the next one"""
+        self._close_shard()
+        self._shard_name = f"shard-{self.shard_count:06d}.tar"
+        self._tar = tarfile.open(self._get_partial_path(), 'w', format=tarfile.GNU_FORMAT)
+        self.shard_count += 1
+    
+    def _get_partial_path(self):
+        return os.path.join(self.dataset_folder, self._shard_name + PARTIAL_TAG)
+    
+    def _close_shard(self):
+        """Close the current shard and rename it into place so readers never see a partial shard"""
+        if self._tar is not None:
+            self._tar.close()
+            os.replace(self._get_partial_path(), os.path.join(self.dataset_folder, self._shard_name))
+            self._tar = None
+    
+    def close(self):
+        self._close_shard()
+
+class MemmapArrayWriter:
+    """Append samples to one flat uint16 file that loaders open with np.memmap"""
+    
+    def __init__(self, dataset_folder, array_file=DATASET_EXPORT['array_file']):
+        self.array_file = array_file
+        self._partial_path = os.path.join(dataset_folder, array_file + PARTIAL_TAG)
+        self._final_path = os.path.join(dataset_folder, array_file)
+        self._file = open(self._partial_path, 'wb')
+    
+    def add(self, sample_key, arrays, metadata):
+        """Append one sample's arrays and return their byte offsets in the array file"""
+        locations = {}
+        for name, array in arrays.items():
+            locations[name] = {'array_file': self.array_file, 'data_offset': self._file.tell()}
+            self._file.write(memoryview(array).cast('B'))
+        return locations
+    
+    def close(self):
+        self._file.close()
+        os.replace(self._partial_path, self._final_path)
+
+def open_sample(dataset_folder, record, lr_name=None):
+    """Map one manifest sample (or one of its LR versions) as a read-only (frames, H, W, 3) array without copying it"""
+    location = record['lr'][lr_name] if lr_name else record
+    file_name = location.get('shard') or location['array_file']
+    return np.memmap(os.path.join(dataset_folder, file_name), dtype=record['dtype'], mode='r',
+                     offset=location['data_offset'], shape=tuple(location['shape']))
+
+def export_movie_samples(json_path, dataset_writer, degrader=None):
+    """Decode the selected frames of one analysis JSON and write one sample per sequence"""
+    video_path, scenes_with_frames = load_analysis_json(json_path)
+    movie_name = os.path.basename(json_path)[:-len('_analysis.json')]
+    if not scenes_with_frames:
+        print_warning(f"No scenes with selected frames found in {os.path.basename(json_path)}")
+        return []
+    
+    records = []
+    for scene_data, frames in iter_selected_sequences(video_path, scenes_with_frames):
+        record = {
+            'sample_key': make_sample_key(movie_name, scene_data['scene_id']),
+            'movie': movie_name,
+            'video_path': video_path,
+            'scene_id': scene_data['scene_id'],
+            'first_frame': scene_data['selected_frames'][0],
+            'last_frame': scene_data['selected_frames'][-1],
+            'frame_count': len(frames),
+            'dtype': 'uint16',
+            'shape': list(frames.shape)
+        }
+        
+        # HR and LR arrays of a sample are written next to each other
+        arrays = {'frames': frames}
+        if degrader is not None:
+            arrays.update(degrader.degrade(frames, seed=scene_data['scene_id']))
+        locations = dataset_writer.add(record['sample_key'], arrays, record)
+        
+        record.update(locations.pop('frames'))
+        if locations:
+            record['lr'] = {
+                name: dict(location, shape=list(arrays[name].shape))
+                for name, location in locations.items()
+            }
+        records.append(record)
+    
+    return records
+
+def save_manifest(dataset_folder, export_format, records):
+    """Write the dataset manifest that maps every sample to its movie, scene and frame range"""
+    manifest = {
+        'format': export_format,
+        'dtype': 'uint16',
+        'channel_order': 'rgb',
+        'layout': 'frames, height, width, channels',
+        'total_samples': len(records),
+        'samples': records
+    }
+    manifest_path = os.path.join(dataset_folder, DATASET_EXPORT['manifest_file'])
+    with open(manifest_path + PARTIAL_TAG, 'w') as f:
+        json.dump(manifest, f, indent=OUTPUT['json_indent'])
+    os.replace(manifest_path + PARTIAL_TAG, manifest_path)
+    return manifest_path
+
+def export_dataset(analysis_results_folder="analysis_results", dataset_folder="dataset", export_format=None):
+    """Export every selected sequence as a training sample, in tar shards or one memmapped array"""
+    export_format = export_format or DATASET_EXPORT['format']
+    print_header("📦 TRAINING DATASET EXPORT")
+    
+    manifest_path = os.path.join(dataset_folder, DATASET_EXPORT['manifest_file'])
+    if os.path.exists(manifest_path):
+        print(f"{Fore.YELLOW}⏩ Skipping export: '{manifest_path}' already exists.{Style.RESET_ALL}")
+        return manifest_path
+    
+    json_files = sorted(f for f in os.listdir(analysis_results_folder) if f.endswith('_analysis.json'))
+    if not json_files:
+        print_warning(f"No analysis JSON files found in '{analysis_results_folder}'")
+        return None
+    
+    os.makedirs(dataset_folder, exist_ok=True)
+    if export_format == 'memmap':
+        dataset_writer = MemmapArrayWriter(dataset_folder)
+    else:
+        dataset_writer = TarShardWriter(dataset_folder)
+    
+    degrader = SequenceDegrader() if DEGRADATION['enabled'] else None
+    records = []
+    try:
+        for json_file in json_files:
+            print_processing(f"Exporting sequences from {json_file}")
+            json_path = os.path.join(analysis_results_folder, json_file)
+            records.extend(export_movie_samples(json_path, dataset_writer, degrader))
+    finally:
+        dataset_writer.close()
+    
+    # The manifest is written last, so its presence marks a complete export
+    manifest_path = save_manifest(dataset_folder, export_format, records)
+    print_success(f"Exported {len(records)} samples to: {Fore.YELLOW}{manifest_path}")
+    return manifest_path
+
+if __name__ == "__main__":
+    export_dataset("analysis_results", "dataset")
\ No newline at end of file
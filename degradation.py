@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from config import DEGRADATION
+
+FULL_SCALE = 65535.0
+
+def get_lr_name(scale, kernel):
+    """Get the folder/member name used for one LR variant"""
+    return f"lr_x{scale}_{kernel}"
+
+def jpeg_round_trip(frames, quality):
+    """Pass each 16-bit RGB frame through 8-bit JPEG encoding and back"""
+    degraded = np.empty_like(frames)
+    for position, frame in enumerate(frames):
+        frame_8bit = cv2.cvtColor((frame >> 8).astype(np.uint8), cv2.COLOR_RGB2BGR)
+        _, encoded = cv2.imencode('.jpg', frame_8bit, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        decoded = cv2.cvtColor(cv2.imdecode(encoded, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        degraded[position] = decoded.astype(np.uint16) * 257
+    return degraded
+
+class SequenceDegrader:
+    """Make LR counterparts of a whole (frames, H, W, 3) uint16 stack with batched tensor ops"""
+    
+    def __init__(self, settings=DEGRADATION):
+        self.settings = settings
+        if settings['device'] == 'auto':
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        else:
+            self.device = torch.device(settings['device'])
+    
+    def degrade(self, frames, seed=0):
+        """Return {lr_name: (frames, H/scale, W/scale, 3) uint16 stack} for every configured scale and kernel"""
+        # One (N, 3, H, W) tensor for the whole sequence
+        hr = torch.from_numpy(frames.astype(np.float32)).to(self.device).permute(0, 3, 1, 2).div_(FULL_SCALE)
+        generator = torch.Generator(device=self.device).manual_seed(seed)
+        height, width = hr.shape[2:]
+        
+        lr_sequences = {}
+        for scale in self.settings['scales']:
+            size = (height // scale, width // scale)
+            for kernel in self.settings['kernels']:
+                if kernel in ('bicubic', 'bilinear'):
+                    lr = F.interpolate(hr, size=size, mode=kernel, align_corners=False, antialias=True)
+                else:
+                    lr = F.interpolate(hr, size=size, mode=kernel)
+                
+                if self.settings['noise_sigma']:
+                    noise = torch.randn(lr.shape, generator=generator, device=self.device)
+                    lr.add_(noise, alpha=self.settings['noise_sigma'])
+                
+                lr = lr.clamp_(0.0, 1.0).mul_(FULL_SCALE).round_().permute(0, 2, 3, 1)
+                lr_frames = lr.to(torch.int32).cpu().numpy().astype(np.uint16)
+                if self.settings['jpeg_quality']:
+                    lr_frames = jpeg_round_trip(lr_frames, self.settings['jpeg_quality'])
+                lr_sequences[get_lr_name(scale, kernel)] = lr_frames
+        
+        return lr_sequences
\ No newline at end of file
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import cv2
+import numpy as np
+from config import OUTPUT, SCENE_DETECTION, VIDEO_CONVERSION
+from frame_writer import PARTIAL_TAG
+from utils import print_success, print_warning
+
+def make_detection_proxy(frame_yuv):
+    """Downscale the luma plane of a yuv420p frame to the small 2D image the detector analyses"""
+    height = frame_yuv.shape[0] * 2 // 3
+    width = frame_yuv.shape[1]
+    detection_width = min(SCENE_DETECTION['detection_width'], width)
+    size = (detection_width, max(round(height * detection_width / width), 1))
+    return cv2.resize(frame_yuv[:height], size, interpolation=cv2.INTER_AREA)
+
+def get_proxy_paths(video_path, cache_folder=None):
+    """Get the raw proxy frames file and its metadata file for a video"""
+    cache_folder = cache_folder or SCENE_DETECTION['proxy_cache_folder']
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    base_path = os.path.join(cache_folder, f"{video_name}_detection_proxy")
+    return f"{base_path}.u8", f"{base_path}.json"
+
+def get_proxy_fingerprint(video_path):
+    """Identify the video and the settings the proxy pixels depend on (not the detection thresholds)"""
+    file_stat = os.stat(video_path)
+    settings = json.dumps([VIDEO_CONVERSION, SCENE_DETECTION['detection_width']], sort_keys=True)
+    return {
+        'file_size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'settings': hashlib.sha1(settings.encode('utf-8')).hexdigest()
+    }
+
+class DetectionProxyWriter:
+    """Append each frame's luma proxy to a raw file that becomes the cache once every frame is written"""
+    
+    def __init__(self, video_path, frame_rate, cache_folder=None):
+        self.frames_path, self.meta_path = get_proxy_paths(video_path, cache_folder)
+        self.fingerprint = get_proxy_fingerprint(video_path)
+        self.frame_rate = frame_rate
+        self.frame_count = 0
+        self._shape = None
+        os.makedirs(os.path.dirname(self.frames_path), exist_ok=True)
+        # An outdated proxy must not validate against the new frames file
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        self._file = open(self.frames_path + PARTIAL_TAG, 'wb')
+    
+    def write(self, proxy):
+        if self._shape is None:
+            self._shape = proxy.shape
+        self._file.write(np.ascontiguousarray(proxy).tobytes())
+        self.frame_count += 1
+    
+    def close(self):
+        """Move the complete proxy into place and record its metadata"""
+        self._file.close()
+        os.replace(self.frames_path + PARTIAL_TAG, self.frames_path)
+        meta = {
+            'fingerprint': self.fingerprint,
+            'frame_rate': self.frame_rate,
+            'frames': self.frame_count,
+            'height': self._shape[0] if self._shape else 0,
+            'width': self._shape[1] if self._shape else 0
+        }
+        with open(self.meta_path, 'w') as f:
+            json.dump(meta, f, indent=OUTPUT['json_indent'])
+        print_success(f"Cached {self.frame_count} detection proxy frames in {os.path.basename(self.frames_path)}")
+    
+    def discard(self):
+        """Drop an incomplete proxy, e.g. after an interrupted decode"""
+        self._file.close()
+        os.remove(self.frames_path + PARTIAL_TAG)
+
+def load_detection_proxy(video_path, cache_folder=None):
+    """Map a cached proxy as a (frames, H, W) uint8 array with its frame rate, or (None, None) if missing or outdated"""
+    frames_path, meta_path = get_proxy_paths(video_path, cache_folder)
+    if not os.path.exists(meta_path) or not os.path.exists(frames_path):
+        return None, None
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    
+    expected_size = meta['frames'] * meta['height'] * meta['width']
+    if meta['fingerprint'] != get_proxy_fingerprint(video_path) or os.path.getsize(frames_path) != expected_size:
+        print_warning(f"Detection proxy {os.path.basename(frames_path)} is outdated; decoding again")
+        return None, None
+    if not expected_size:
+        return np.zeros((0, meta['height'], meta['width']), dtype=np.uint8), meta['frame_rate']
+    proxy = np.memmap(frames_path, dtype=np.uint8, mode='r', shape=(meta['frames'], meta['height'], meta['width']))
+    return proxy, meta['frame_rate']
\ No newline at end of file
@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from collections import deque
+from colorama import Fore
+from config import FRAME_CACHE, OUTPUT
+from frame_writer import PARTIAL_TAG, frame_to_rgb48
+from profiling import stage_profiler
+from utils import get_base_filename, print_info, print_success, print_warning
+
+def get_frame_cache_folder(video_path, cache_folder=None):
+    return os.path.join(cache_folder or FRAME_CACHE['cache_folder'], get_base_filename(video_path))
+
+def get_sequence_file_name(scene_id, selected_frames):
+    """Name a cached sequence after its scene and frame range, so a changed selection never matches it"""
+    return f"scene{scene_id:04d}_{selected_frames[0]:06d}-{selected_frames[-1]:06d}.npy"
+
+def get_video_fingerprint(video_path):
+    file_stat = os.stat(video_path)
+    return {'file_size': file_stat.st_size, 'mtime': file_stat.st_mtime}
+
+def get_folder_bytes(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+class FrameCacheWriter:
+    """Keep the last decoded full-resolution frames and cache each selected sequence from them
+    
+    The decoder adds every frame with add_frame (from the decode thread in threaded mode);
+    cache_sequence is called with each scene result and writes its selected frames as one
+    (frames, H, W, 3) uint16 RGB .npy array, the same pixels frame extraction would decode.
+    A selection made while its scene goes on decoding (full-scene scoring, reused duplicate
+    selections) is passed to hold_frames, so its frames outlive the ring.
+    """
+    
+    def __init__(self, video_path, ring_frames, cache_folder=None):
+        self.movie_folder = get_frame_cache_folder(video_path, cache_folder)
+        self.ring_frames = max(ring_frames, 1)
+        self.sequences_cached = 0
+        self._frames = {}
+        self._order = deque()
+        self._held_frames = {}
+        self._wanted_frames = set()
+        self._lock = threading.Lock()
+        self._over_budget = False
+    
+    def add_frame(self, frame_idx, frame):
+        """Hold a decoded frame, releasing the oldest one once the ring is full"""
+        with self._lock:
+            self._frames[frame_idx] = frame
+            self._order.append(frame_idx)
+            if frame_idx in self._wanted_frames:
+                self._held_frames[frame_idx] = frame
+            while len(self._order) > self.ring_frames:
+                self._frames.pop(self._order.popleft(), None)
+    
+    def hold_frames(self, frame_numbers):
+        """Keep the given frames (already decoded or still to come) until the scene result arrives"""
+        with self._lock:
+            for frame_number in frame_numbers:
+                frame_idx = frame_number - 1
+                if frame_idx in self._frames:
+                    self._held_frames[frame_idx] = self._frames[frame_idx]
+                else:
+                    self._wanted_frames.add(frame_idx)
+    
+    def cache_sequence(self, scene_result):
+        """Write a scene's selected frames to the cache if they are all still held"""
+        with self._lock:
+            held_frames = self._held_frames
+            self._held_frames = {}
+            self._wanted_frames = set()
+            if not scene_result['sequence_found'] or self._over_budget:
+                return None
+            selected_frames = scene_result['selected_frames']
+            frames = [self._frames.get(frame_number - 1, held_frames.get(frame_number - 1)) for frame_number in selected_frames]
+        if any(frame is None for frame in frames):
+            print_warning(f"Scene {scene_result['scene_id']}: selected frames already released, not cached")
+            return None
+        
+        with stage_profiler.stage('frame_cache_write', items=len(frames)):
+            first_frame = frame_to_rgb48(frames[0])
+            os.makedirs(self.movie_folder, exist_ok=True)
+            sequence_path = os.path.join(self.movie_folder, get_sequence_file_name(scene_result['scene_id'], selected_frames))
+            partial_path = sequence_path + PARTIAL_TAG
+            sequence = np.lib.format.open_memmap(partial_path, mode='w+', dtype=np.uint16,
+                                                 shape=(len(frames),) + first_frame.shape)
+            # The file is sized up front, so the folder total counts the sequences other scene
+            # workers of this movie are writing too; the budget holds across all of them
+            if get_folder_bytes(self.movie_folder) > FRAME_CACHE['max_bytes']:
+                del sequence
+                os.remove(partial_path)
+                self._over_budget = True
+                print_warning("Frame cache budget reached; later sequences of this movie are not cached")
+                return None
+            
+            sequence[0] = first_frame
+            for position, frame in enumerate(frames[1:], 1):
+                sequence[position] = frame_to_rgb48(frame)
+            sequence.flush()
+            del sequence
+            os.replace(partial_path, sequence_path)
+        
+        self.sequences_cached += 1
+        return sequence_path
+
+def clear_frame_cache(video_path, cache_folder=None):
+    """Drop a movie's cached sequences before it is analysed from scratch"""
+    shutil.rmtree(get_frame_cache_folder(video_path, cache_folder), ignore_errors=True)
+
+def save_frame_cache_index(video_path, scene_results, cache_folder=None):
+    """Record the cached sequences of a finished movie, drop stale files, then evict old movies over the budget
+    
+    The index is written last, so a movie only becomes readable once its analysis is complete.
+    """
+    movie_folder = get_frame_cache_folder(video_path, cache_folder)
+    if not os.path.isdir(movie_folder):
+        return None
+    
+    sequences = {}
+    for scene_result in scene_results:
+        if scene_result['sequence_found']:
+            file_name = get_sequence_file_name(scene_result['scene_id'], scene_result['selected_frames'])
+            if os.path.exists(os.path.join(movie_folder, file_name)):
+                sequences[str(scene_result['scene_id'])] = file_name
+    
+    # Sequences of an earlier run with other settings are no longer referenced
+    for file_name in os.listdir(movie_folder):
+        if file_name != FRAME_CACHE['index_file'] and file_name not in sequences.values():
+            os.remove(os.path.join(movie_folder, file_name))
+    
+    index = {
+        'video': os.path.basename(video_path),
+        'fingerprint': get_video_fingerprint(video_path),
+        'sequences': sequences
+    }
+    index_path = os.path.join(movie_folder, FRAME_CACHE['index_file'])
+    with open(index_path + PARTIAL_TAG, 'w') as f:
+        json.dump(index, f, indent=OUTPUT['json_indent'])
+    os.replace(index_path + PARTIAL_TAG, index_path)
+    print_success(f"Cached {len(sequences)} full-resolution sequences in {Fore.YELLOW}{movie_folder}")
+    evict_frame_cache(cache_folder, keep_folder=movie_folder)
+    return index_path
+
+def load_cached_sequences(video_path, scenes_with_frames, cache_folder=None):
+    """Map the cached sequences of a movie's selected scenes read-only, by scene id
+    
+    Scenes whose selection is not cached (or a movie cached from another version of the
+    file) are left out, to be decoded as before. A read counts as a use for eviction.
+    """
+    movie_folder = get_frame_cache_folder(video_path, cache_folder)
+    index_path = os.path.join(movie_folder, FRAME_CACHE['index_file'])
+    if not FRAME_CACHE['enabled'] or not os.path.exists(index_path):
+        return {}
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    if not os.path.exists(video_path) or index['fingerprint'] != get_video_fingerprint(video_path):
+        print_warning(f"Frame cache of {os.path.basename(video_path)} is outdated; decoding again")
+        return {}
+    
+    cached_sequences = {}
+    for scene_data in scenes_with_frames:
+        file_name = get_sequence_file_name(scene_data['scene_id'], scene_data['selected_frames'])
+        if index['sequences'].get(str(scene_data['scene_id'])) == file_name:
+            cached_sequences[scene_data['scene_id']] = np.load(os.path.join(movie_folder, file_name), mmap_mode='r')
+    
+    os.utime(index_path)
+    if cached_sequences:
+        print_info(f"Reading {Fore.YELLOW}{len(cached_sequences)}/{len(scenes_with_frames)}{Fore.BLUE} sequences from the frame cache")
+    return cached_sequences
+
+def evict_frame_cache(cache_folder=None, max_bytes=None, keep_folder=None):
+    """Remove the least recently used movies until the cache fits in max_bytes"""
+    cache_folder = cache_folder or FRAME_CACHE['cache_folder']
+    max_bytes = FRAME_CACHE['max_bytes'] if max_bytes is None else max_bytes
+    movies = []
+    for entry in os.scandir(cache_folder):
+        index_path = os.path.join(entry.path, FRAME_CACHE['index_file'])
+        # Movies still being analysed have no index yet and are left alone
+        if entry.is_dir() and os.path.exists(index_path):
+            movies.append((os.stat(index_path).st_mtime, get_folder_bytes(entry.path), entry.path))
+    
+    total_bytes = sum(size for _mtime, size, _path in movies)
+    removed = 0
+    for _mtime, size, path in sorted(movies):
+        if total_bytes <= max_bytes:
+            break
+        if os.path.abspath(path) == os.path.abspath(keep_folder or ''):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total_bytes -= size
+        removed += 1
+    if removed:
+        print_info(f"Evicted {removed} least recently used movies from the frame cache")
+    return removed
\ No newline at end of file
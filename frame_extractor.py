@@ -3,8 +3,16 @@ import os
 import av
 import cv2
 import numpy as np
+from collections import defaultdict
+from datetime import datetime
 from tqdm import tqdm
 from colorama import Fore, Style
+from config import DEGRADATION, FRAME_EXTRACTION, OUTPUT
+from degradation import SequenceDegrader
+from frame_cache import load_cached_sequences
+from frame_writer import OUTPUT_EXTENSIONS, PARTIAL_TAG, FrameWriterPool, frame_to_rgb48
+from profiling import stage_profiler
+from video_reader import configure_decoder_threads, iter_frames_by_seeking
 
 def load_analysis_json(json_path):
     with open(json_path, 'r') as f:
@@ -33,6 +41,7 @@ def get_all_selected_frames(scenes_with_frames):
 def read_selected_frames_once(video_path, selected_frames_dict):
     container = av.open(video_path)
     video_stream = container.streams.video[0]
+    configure_decoder_threads(video_stream)
     total_frames = video_stream.frames
     
     if total_frames == 0:
@@ -54,31 +63,123 @@ def read_selected_frames_once(video_path, selected_frames_dict):
     container.close()
     return extracted_frames
 
+def get_frame_output_path(output_folder, scene_id, frame_number):
+    """Get the output path of a selected frame inside its scene folder"""
+    scene_folder = os.path.join(output_folder, f"scene_{scene_id:02d}")
+    extension = OUTPUT_EXTENSIONS[FRAME_EXTRACTION['output_format']]
+    return os.path.join(scene_folder, f"frame_{frame_number:06d}{extension}")
+
 def save_frames_to_png(extracted_frames, scenes_with_frames, output_folder):
     os.makedirs(output_folder, exist_ok=True)
+    frame_writer = FrameWriterPool()
+    saved_frames = 0
+    
+    try:
+        for scene_data in scenes_with_frames:
+            scene_id = scene_data['scene_id']
+            selected_frames = scene_data['selected_frames']
+            
+            for frame_number in tqdm(selected_frames, desc=f"Saving Scene {scene_id}"):
+                if frame_number in extracted_frames:
+                    output_path = get_frame_output_path(output_folder, scene_id, frame_number)
+                    frame_writer.submit(extracted_frames[frame_number], output_path)
+                    saved_frames += 1
+    finally:
+        frame_writer.close()
+    return saved_frames
+
+def iter_selected_sequences(video_path, scenes_with_frames):
+    """Yield (scene_data, frames) with each selected sequence stacked as a (frames, H, W, 3) uint16 RGB array
     
+    Sequences in the frame cache are yielded first as read-only memmaps; only the rest is decoded.
+    """
+    cached_sequences = load_cached_sequences(video_path, scenes_with_frames)
     for scene_data in scenes_with_frames:
-        scene_id = scene_data['scene_id']
-        selected_frames = scene_data['selected_frames']
-        
-        scene_folder = os.path.join(output_folder, f"scene_{scene_id:02d}")
-        os.makedirs(scene_folder, exist_ok=True)
-        
-        for frame_number in tqdm(selected_frames, desc=f"Saving Scene {scene_id}"):
-            if frame_number in extracted_frames:
-                frame = extracted_frames[frame_number]
-                output_filename = f"frame_{frame_number:06d}.png"
-                output_path = os.path.join(scene_folder, output_filename)
-                
-                # Convert xyz12le to rgb48le (16-bit RGB) using PyAV
-                rgb_frame = frame.reformat(format='rgb48le')
-                frame_array = rgb_frame.to_ndarray()
-                
-                # OpenCV expects BGR format for 16-bit PNG
-                bgr_16bit = cv2.cvtColor(frame_array, cv2.COLOR_RGB2BGR)
-                
-                # Save as 16-bit PNG using OpenCV
-                cv2.imwrite(output_path, bgr_16bit)
+        if scene_data['scene_id'] in cached_sequences:
+            yield scene_data, cached_sequences[scene_data['scene_id']]
+    scenes_with_frames = [scene_data for scene_data in scenes_with_frames if scene_data['scene_id'] not in cached_sequences]
+    if not scenes_with_frames:
+        return
+    
+    # Adjacent scenes share a boundary frame, so a frame can belong to two sequences
+    frame_slots = defaultdict(list)
+    for sequence_idx, scene_data in enumerate(scenes_with_frames):
+        for position, frame_number in enumerate(scene_data['selected_frames']):
+            frame_slots[frame_number].append((sequence_idx, position))
+    
+    sequences = {}
+    missing_frames = {}
+    for frame_number, frame in tqdm(iter_frames_by_seeking(video_path, frame_slots), total=len(frame_slots),
+                                    desc="Decoding selected sequences", unit="frame"):
+        rgb_array = frame_to_rgb48(frame)
+        for sequence_idx, position in frame_slots[frame_number]:
+            if sequence_idx not in sequences:
+                sequence_length = len(scenes_with_frames[sequence_idx]['selected_frames'])
+                sequences[sequence_idx] = np.empty((sequence_length,) + rgb_array.shape, dtype=np.uint16)
+                missing_frames[sequence_idx] = sequence_length
+            sequences[sequence_idx][position] = rgb_array
+            missing_frames[sequence_idx] -= 1
+            
+            # Hand out a sequence as soon as its last frame arrives so only a few are held in memory
+            if missing_frames[sequence_idx] == 0:
+                yield scenes_with_frames[sequence_idx], sequences.pop(sequence_idx)
+    
+    if sequences:
+        print(f"{Fore.YELLOW}⚠️ {len(sequences)} sequences could not be fully decoded and were skipped")
+
+def extract_sequences_with_lr(video_path, scenes_with_frames, output_folder):
+    """Save each selected sequence together with its degraded LR versions from one decoding pass"""
+    degrader = SequenceDegrader()
+    frame_writer = FrameWriterPool()
+    saved_frames = 0
+    
+    try:
+        for scene_data, frames in iter_selected_sequences(video_path, scenes_with_frames):
+            scene_id = scene_data['scene_id']
+            lr_sequences = degrader.degrade(frames, seed=scene_id)
+            for position, frame_number in enumerate(scene_data['selected_frames']):
+                output_path = get_frame_output_path(output_folder, scene_id, frame_number)
+                frame_writer.submit_array(frames[position], output_path)
+                for lr_name, lr_frames in lr_sequences.items():
+                    lr_path = os.path.join(os.path.dirname(output_path), lr_name, os.path.basename(output_path))
+                    frame_writer.submit_array(lr_frames[position], lr_path)
+                saved_frames += 1
+    finally:
+        frame_writer.close()
+    return saved_frames
+
+def extract_cached_sequences(cached_sequences, scenes_with_frames, output_folder):
+    """Save the frames of sequences mapped from the frame cache, without decoding"""
+    frame_writer = FrameWriterPool()
+    saved_frames = 0
+    
+    try:
+        for scene_data in scenes_with_frames:
+            frames = cached_sequences.get(scene_data['scene_id'])
+            if frames is None:
+                continue
+            for position, frame_number in enumerate(scene_data['selected_frames']):
+                frame_writer.submit_array(frames[position], get_frame_output_path(output_folder, scene_data['scene_id'], frame_number))
+                saved_frames += 1
+    finally:
+        frame_writer.close()
+    return saved_frames
+
+def extract_frames_by_seeking(video_path, selected_frames_dict, output_folder):
+    """Seek to the keyframe before each selected run and save frames as they are decoded"""
+    frame_writer = FrameWriterPool()
+    saved_frames = 0
+    
+    try:
+        with tqdm(total=len(selected_frames_dict), desc="Extracting selected frames", unit="frame") as pbar:
+            for frame_number, frame in iter_frames_by_seeking(video_path, selected_frames_dict):
+                output_path = get_frame_output_path(output_folder, selected_frames_dict[frame_number], frame_number)
+                frame_writer.submit(frame, output_path)
+                saved_frames += 1
+                pbar.update(1)
+    finally:
+        frame_writer.close()
+    return saved_frames
 
 def extract_movie_name_from_json(json_filename):
     """Extract movie name from JSON filename by removing '_analysis.json' suffix"""
@@ -87,13 +188,31 @@ def extract_movie_name_from_json(json_filename):
     else:
         return os.path.splitext(json_filename)[0]
 
+def get_completion_marker_path(movie_output_folder):
+    """Get the path of the marker written once all frames of a movie are extracted"""
+    return os.path.join(movie_output_folder, FRAME_EXTRACTION['completion_marker'])
+
+def mark_extraction_complete(movie_output_folder, json_path, frames_selected):
+    """Write the completion marker; it only appears after every frame file is in place"""
+    marker_path = get_completion_marker_path(movie_output_folder)
+    marker = {
+        'analysis_json': os.path.basename(json_path),
+        'frames_selected': frames_selected,
+        'output_format': FRAME_EXTRACTION['output_format'],
+        'completed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    os.makedirs(movie_output_folder, exist_ok=True)
+    with open(marker_path + PARTIAL_TAG, 'w') as f:
+        json.dump(marker, f, indent=OUTPUT['json_indent'])
+    os.replace(marker_path + PARTIAL_TAG, marker_path)
+
 def get_json_files_to_process(analysis_results_folder, extracted_frames_folder):
     """Get list of JSON files that need processing"""
     if not os.path.exists(analysis_results_folder):
         print(f"{Fore.RED}❌ Analysis results folder '{analysis_results_folder}' not found!")
         return []
     
-    json_files = [f for f in os.listdir(analysis_results_folder) if f.endswith('.json')]
+    json_files = [f for f in os.listdir(analysis_results_folder) if f.endswith('_analysis.json')]
     
     if not json_files:
         print(f"{Fore.YELLOW}⚠️ No JSON files found in '{analysis_results_folder}'")
@@ -106,7 +225,7 @@ def get_json_files_to_process(analysis_results_folder, extracted_frames_folder):
         movie_output_folder = os.path.join(extracted_frames_folder, movie_name)
         
         # Check if this movie has already been processed
-        if os.path.exists(movie_output_folder) and os.listdir(movie_output_folder):
+        if os.path.exists(get_completion_marker_path(movie_output_folder)):
             print(f"{Fore.YELLOW}⏩ Skipping '{json_file}': Frames already extracted for '{movie_name}'")
             continue
         
@@ -128,14 +247,43 @@ def extract_selected_frames(json_path, output_folder):
         print(f"{Fore.YELLOW}⚠️ No frames to extract from {os.path.basename(json_path)}")
         return
     
+    stage_profiler.reset()
     print(f"{Fore.CYAN}📹 Processing: {os.path.basename(json_path)}")
     print(f"{Fore.CYAN}🎬 Video: {os.path.basename(video_path)}")
     print(f"{Fore.CYAN}📁 Output: {output_folder}")
     print(f"{Fore.CYAN}🎯 Total frames to extract: {len(selected_frames_dict)}")
     
-    extracted_frames = read_selected_frames_once(video_path, selected_frames_dict)
-    save_frames_to_png(extracted_frames, scenes_with_frames, output_folder)
+    # Per-scene writers save a frame shared by two adjacent scenes once for each scene
+    if DEGRADATION['enabled']:
+        frames_expected = sum(len(scene_data['selected_frames']) for scene_data in scenes_with_frames)
+        frames_saved = extract_sequences_with_lr(video_path, scenes_with_frames, output_folder)
+    else:
+        # Sequences cached during analysis are copied out; only the rest is decoded
+        cached_sequences = load_cached_sequences(video_path, scenes_with_frames)
+        frames_to_decode = selected_frames_dict
+        frames_expected = frames_saved = 0
+        if cached_sequences:
+            frames_expected += sum(len(scene_data['selected_frames']) for scene_data in scenes_with_frames
+                                   if scene_data['scene_id'] in cached_sequences)
+            frames_saved += extract_cached_sequences(cached_sequences, scenes_with_frames, output_folder)
+            frames_to_decode = {n: scene_id for n, scene_id in selected_frames_dict.items() if scene_id not in cached_sequences}
+            scenes_with_frames = [scene_data for scene_data in scenes_with_frames if scene_data['scene_id'] not in cached_sequences]
+        
+        if frames_to_decode and FRAME_EXTRACTION['mode'] == 'seek':
+            frames_expected += len(frames_to_decode)
+            frames_saved += extract_frames_by_seeking(video_path, frames_to_decode, output_folder)
+        elif frames_to_decode:
+            frames_expected += sum(len(scene_data['selected_frames']) for scene_data in scenes_with_frames)
+            extracted_frames = read_selected_frames_once(video_path, frames_to_decode)
+            frames_saved += save_frames_to_png(extracted_frames, scenes_with_frames, output_folder)
     
+    stage_profiler.save_report(output_folder, 'extraction')
+    # A truncated or partly decodable video leaves the movie unmarked, so the next run retries it
+    if frames_saved != frames_expected:
+        print(f"{Fore.YELLOW}⚠️ Only {frames_saved}/{frames_expected} frames of {os.path.basename(json_path)} were saved; "
+              f"not marking it as extracted")
+        return
+    mark_extraction_complete(output_folder, json_path, len(selected_frames_dict))
     print(f"{Fore.GREEN}✅ Successfully extracted frames for {os.path.basename(json_path)}")
 
 def process_all_analysis_files(analysis_results_folder="analysis_results", extracted_frames_folder="extracted_frames"):
@@ -0,0 +1,168 @@
+import numpy as np
+import torch
+from config import QUALITY_ANALYSIS
+
+# ITU-R BT.601 limited-range coefficients, as used by cv2.COLOR_YUV2BGR_I420
+LUMA_OFFSET = 16.0
+CHROMA_OFFSET = 128.0
+LUMA_SCALE = 1.164
+V_TO_R = 1.596
+V_TO_G = -0.813
+U_TO_G = -0.391
+U_TO_B = 2.018
+
+def compute_frame_std(frames_yuv):
+    """Get the standard deviation of every frame in a stacked (N, H*3/2, W) uint8 block in one pass"""
+    flat = frames_yuv.reshape(len(frames_yuv), -1)
+    mean = flat.mean(axis=1, dtype=np.float64)
+    mean_square = np.einsum('ij,ij->i', flat, flat, dtype=np.float64) / flat.shape[1]
+    return np.sqrt(np.maximum(mean_square - mean ** 2, 0.0))
+
+def compact_frames(frames_yuv, keep):
+    """Move the kept frames to the front of the block in place, preserving their order"""
+    for target, source in enumerate(keep):
+        if target != source:
+            frames_yuv[target] = frames_yuv[source]
+
+def convert_yuv420_to_rgb(frames_yuv, out, chroma):
+    """Convert stacked I420 frames straight to normalized RGB
+    
+    frames_yuv is an (N, H*3/2, W) uint8 array, out an (N, 3, H, W) float32 tensor and
+    chroma an (N, 2, H/2, W/2) float32 scratch tensor; both are written in place.
+    """
+    count, rows, width = frames_yuv.shape
+    height = rows * 2 // 3
+    yuv = torch.from_numpy(frames_yuv)
+    
+    # Scaled luma is the common term of all three channels (below-black luma clamps like OpenCV)
+    luma = out[:, 0]
+    luma.copy_(yuv[:, :height]).sub_(LUMA_OFFSET).clamp_(min=0.0).mul_(LUMA_SCALE / 255.0)
+    out[:, 1].copy_(luma)
+    out[:, 2].copy_(luma)
+    
+    # Each chroma sample covers a 2x2 block of luma samples
+    chroma.copy_(yuv[:, height:].reshape(count, 2, height // 2, width // 2)).sub_(CHROMA_OFFSET).div_(255.0)
+    u = chroma[:, 0, :, None, :, None]
+    v = chroma[:, 1, :, None, :, None]
+    
+    def channel_blocks(channel):
+        return out[:, channel].view(count, height // 2, 2, width // 2, 2)
+    
+    channel_blocks(0).add_(v, alpha=V_TO_R)
+    channel_blocks(1).add_(v, alpha=V_TO_G).add_(u, alpha=U_TO_G)
+    channel_blocks(2).add_(u, alpha=U_TO_B)
+    return out.clamp_(0.0, 1.0)
+
+def downscale_luma(frames_yuv, factor):
+    """Box-downscale the luma planes of a stacked I420 block to (N, H/factor, W/factor) float32"""
+    count, rows, width = frames_yuv.shape
+    height = rows * 2 // 3
+    cropped_height = height // factor * factor
+    cropped_width = width // factor * factor
+    luma = frames_yuv[:, :cropped_height, :cropped_width]
+    luma = luma.reshape(count, cropped_height // factor, factor, cropped_width // factor, factor)
+    return luma.mean(axis=(2, 4), dtype=np.float32)
+
+def compute_clipped_ratio(luma, low, high):
+    """Get the fraction of crushed or blown-out luma samples per frame"""
+    return ((luma <= low) | (luma >= high)).mean(axis=(1, 2))
+
+def compute_laplacian_variance(luma):
+    """Get the variance of the 4-neighbour Laplacian per frame (low means blurry)"""
+    laplacian = (4.0 * luma[:, 1:-1, 1:-1] - luma[:, :-2, 1:-1] - luma[:, 2:, 1:-1]
+                 - luma[:, 1:-1, :-2] - luma[:, 1:-1, 2:])
+    return laplacian.var(axis=(1, 2))
+
+def compute_blockiness(luma, grid):
+    """Get the ratio of luma steps on the coding grid (8x8 blocks are grid x grid after downscaling) to all steps (1.0 means no blocking)"""
+    column_steps = np.abs(np.diff(luma, axis=2))
+    row_steps = np.abs(np.diff(luma, axis=1))
+    on_grid = column_steps[:, :, grid - 1::grid].mean(axis=(1, 2)) + row_steps[:, grid - 1::grid, :].mean(axis=(1, 2))
+    overall = column_steps.mean(axis=(1, 2)) + row_steps.mean(axis=(1, 2))
+    return on_grid / np.maximum(overall, 1e-6)
+
+def compute_banding(luma):
+    """Get the share of flat steps among smooth luma transitions (close to 1.0 means posterized)"""
+    column_steps = np.abs(np.diff(luma, axis=2))
+    smooth = (column_steps <= 2).sum(axis=(1, 2))
+    flat = (column_steps == 0).sum(axis=(1, 2))
+    return flat / np.maximum(smooth, 1)
+
+class PrefilterCascade:
+    """Cheap per-frame checks run over whole batches before the IQA metrics, cheapest first"""
+    
+    # (stage, threshold setting); a stage is skipped while its threshold is None
+    STAGES = [
+        ('clipping', 'max_clipped_ratio'),
+        ('sharpness', 'min_sharpness'),
+        ('blockiness', 'max_blockiness'),
+        ('banding', 'max_banding')
+    ]
+    
+    def __init__(self, settings):
+        # Block edges only stay on whole downscaled pixels when the factor divides the 8x8 grid
+        if settings['max_blockiness'] is not None and settings['luma_downscale'] not in (1, 2, 4):
+            raise ValueError("PREFILTER['max_blockiness'] needs a luma_downscale of 1, 2 or 4")
+        self.settings = settings
+        self.frames_checked = 0
+        self.rejected = {'low_variance': 0}
+        self.rejected.update({stage: 0 for stage, _ in self.STAGES})
+    
+    def apply(self, frames_yuv, frame_std, keep):
+        """Return the indices in keep whose frames pass every enabled stage"""
+        self.frames_checked += len(frame_std)
+        self.rejected['low_variance'] += len(frame_std) - len(keep)
+        return self.filter(frames_yuv, keep, self.rejected)
+    
+    def filter(self, frames_yuv, keep, rejected=None):
+        """Return the indices in keep whose frames pass every enabled stage, counting rejects into rejected"""
+        if not self.settings['enabled']:
+            return keep
+        
+        luma = None
+        for stage, threshold_key in self.STAGES:
+            threshold = self.settings[threshold_key]
+            if threshold is None or not len(keep):
+                continue
+            if luma is None:
+                # Every stage reads the same downscaled luma, computed once per batch
+                kept_frames = frames_yuv if len(keep) == len(frames_yuv) else frames_yuv[keep]
+                luma = downscale_luma(kept_frames, self.settings['luma_downscale'])
+            passed = self._passes(stage, threshold, luma)
+            if rejected is not None:
+                rejected[stage] += int(len(keep) - passed.sum())
+            keep = keep[passed]
+            luma = luma[passed]
+        return keep
+    
+    def _passes(self, stage, threshold, luma):
+        """Evaluate one stage over a stack of downscaled luma planes, returning a per-frame pass mask"""
+        if stage == 'clipping':
+            return compute_clipped_ratio(luma, self.settings['clip_low'], self.settings['clip_high']) <= threshold
+        if stage == 'sharpness':
+            return compute_laplacian_variance(luma) >= threshold
+        if stage == 'blockiness':
+            return compute_blockiness(luma, 8 // self.settings['luma_downscale']) <= threshold
+        return compute_banding(luma) <= threshold
+    
+    def restore_stats(self, stats):
+        """Continue counting from the stats of an interrupted run"""
+        self.frames_checked = stats['frames_checked']
+        self.rejected.update(stats['rejected'])
+    
+    def add_stats(self, stats):
+        """Add the counts of a cascade that ran in another worker"""
+        self.frames_checked += stats['frames_checked']
+        for stage, count in stats['rejected'].items():
+            self.rejected[stage] += count
+    
+    def get_stats(self):
+        """Summarize reject counts and thresholds for the analysis JSON"""
+        thresholds = {key: value for key, value in self.settings.items() if key != 'enabled'}
+        thresholds['min_frame_variance'] = QUALITY_ANALYSIS['min_frame_variance']
+        return {
+            'enabled': self.settings['enabled'],
+            'frames_checked': self.frames_checked,
+            'rejected': dict(self.rejected),
+            'thresholds': thresholds
+        }
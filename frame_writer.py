@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from config import FRAME_EXTRACTION
+from profiling import stage_profiler
+
+OUTPUT_EXTENSIONS = {'png': '.png', 'tiff': '.tiff', 'npy': '.npy'}
+
+# Frames are written under this tag first and renamed once complete
+PARTIAL_TAG = '.partial'
+
+def get_partial_path(output_path):
+    """Get the temporary path a frame is written to before it is renamed into place"""
+    root, extension = os.path.splitext(output_path)
+    return f"{root}{PARTIAL_TAG}{extension}"
+
+def frame_to_rgb48(frame):
+    """Convert a decoded PyAV frame to a 16-bit RGB array"""
+    # Convert xyz12le to rgb48le (16-bit RGB) using PyAV
+    return frame.reformat(format='rgb48le').to_ndarray()
+
+def write_frame_array(rgb_array, output_path, output_format, png_compression):
+    """Write a 16-bit RGB array to a temp file, then rename it to its final path"""
+    with stage_profiler.stage(f"{output_format}_encode", items=1):
+        return _write_frame_array(rgb_array, output_path, output_format, png_compression)
+
+def _write_frame_array(rgb_array, output_path, output_format, png_compression):
+    partial_path = get_partial_path(output_path)
+    
+    if output_format == 'npy':
+        # Raw arrays can be opened later with np.load(..., mmap_mode='r')
+        with open(partial_path, 'wb') as f:
+            np.save(f, rgb_array)
+    else:
+        # OpenCV expects BGR format for 16-bit images
+        bgr_16bit = cv2.cvtColor(rgb_array, cv2.COLOR_RGB2BGR)
+        if output_format == 'tiff':
+            params = [cv2.IMWRITE_TIFF_COMPRESSION, 1]  # 1 = uncompressed
+        else:
+            params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        if not cv2.imwrite(partial_path, bgr_16bit, params):
+            raise IOError(f"Could not write {partial_path}")
+    
+    os.replace(partial_path, output_path)
+    return output_path
+
+class FrameWriterPool:
+    """Encode and write frames on a pool of threads or processes while decoding continues"""
+    
+    def __init__(self, settings=FRAME_EXTRACTION):
+        self.output_format = settings['output_format']
+        self.png_compression = settings['png_compression']
+        self.frames_written = 0
+        workers = max(settings['writer_workers'], 1)
+        if settings['writer_backend'] == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            # cv2.imwrite and zlib release the GIL, so threads already encode in parallel
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-writer")
+        self._max_pending = workers * 2
+        self._pending = set()
+    
+    def submit(self, frame, output_path):
+        """Queue a decoded frame for writing; blocks while too many frames are in flight"""
+        with stage_profiler.stage('rgb48_convert', items=1):
+            rgb_array = frame_to_rgb48(frame)
+        self.submit_array(rgb_array, output_path)
+    
+    def submit_array(self, rgb_array, output_path):
+        """Queue an already converted 16-bit RGB array for writing"""
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        while len(self._pending) >= self._max_pending:
+            self._collect(FIRST_COMPLETED)
+        self._pending.add(self._executor.submit(
+            write_frame_array, rgb_array, output_path, self.output_format, self.png_compression
+        ))
+    
+    def _collect(self, return_when):
+        """Wait for in-flight writes and re-raise the first failure"""
+        done, self._pending = wait(self._pending, return_when=return_when)
+        for future in done:
+            future.result()
+            self.frames_written += 1
+    
+    def close(self):
+        """Wait for all queued frames to be written and shut the pool down"""
+        try:
+            self._collect(ALL_COMPLETED)
+        finally:
+            self._executor.shutdown(wait=True)
+        return self.frames_written
\ No newline at end of file
@@ -1,42 +1,139 @@
+import argparse
 import os
 from colorama import Fore, Style
 
 # Import all modules
-from video_reader import read_mxf_video
-from scene_detector import find_and_split_scenes
+from video_reader import get_frame_pool_size, read_mxf_video
+from scene_detector import SceneSplitter, find_and_split_scenes
+from scene_cache import load_cached_scenes, save_cached_scenes
+from scene_index import save_scene_index
+from frame_cache import FrameCacheWriter, clear_frame_cache, save_frame_cache_index
 from quality_analyzer import initialize_quality_metrics, find_sequence_per_scene,find_sequences_per_scene_niqe_only
 from data_exporter import save_analysis_json
-from utils import print_header, print_step, print_success, get_base_filename
-from config import DEVICE,QUALITY_ANALYSIS
+from frame_preprocessor import PrefilterCascade
+from score_store import ScoreStore, get_scores_path
+from threaded_pipeline import ThreadedFrameReader
+from scene_parallel import analyze_scenes_in_parallel
+from checkpoint import CheckpointJournal, get_checkpoint_path
+from batch_runner import run_batch
+from work_queue import run_worker
+from profiling import run_profiled, stage_profiler
+from utils import disable_color, print_header, print_step, print_success, get_base_filename
+from config import DEVICE,FRAME_CACHE,QUALITY_ANALYSIS,SCORE_STORE,PIPELINE,PREFILTER,PROFILING,SCENE_CACHE,SCENE_DEDUP,WORK_QUEUE
 
-def process_mxf_complete_pipeline(mxf_file_path, output_folder):
-    """Complete MXF analysis pipeline: read video, detect scenes, analyze frame quality"""
+class PipelineAborted(RuntimeError):
+    """Raised when the caller stops a running analysis, e.g. after losing its work queue lease"""
+
+def process_mxf_complete_pipeline(mxf_file_path, output_folder, quality_metrics=None, should_abort=None):
+    """Complete MXF analysis pipeline: read video, detect scenes, analyze frame quality
+    
+    quality_metrics is an already loaded (musiq_metric, niqe_metric, device) tuple to reuse.
+    should_abort is checked after every scene and before any result is written; when it
+    returns True the run stops with PipelineAborted and writes nothing more.
+    """
+    
+    def check_abort():
+        if should_abort is not None and should_abort():
+            raise PipelineAborted(f"Analysis of {os.path.basename(mxf_file_path)} aborted")
     
     print_header("🚀 STARTING MXF VIDEO ANALYSIS PIPELINE")
+    stage_profiler.reset()
+    base_video_name = get_base_filename(mxf_file_path)
+    score_store = ScoreStore() if SCORE_STORE['enabled'] else None
+    prefilter = PrefilterCascade(PREFILTER)
     
-    # Step 1: Read and convert MXF video
-    print_step(1, "Reading MXF file and converting frames")
-    frames_list, video_info = read_mxf_video(mxf_file_path)
+    # Scenes finished by an interrupted run are restored from the checkpoint journal
+    scene_parallel = PIPELINE['mode'] == 'scene_parallel'
+    journal = None
+    completed = []
+    if not scene_parallel:
+        journal = CheckpointJournal(get_checkpoint_path(output_folder, base_video_name), mxf_file_path, score_store, prefilter)
+        completed = journal.resume()
+    completed_scenes = [entry['scene'] for entry in completed]
+    # Resume decoding one frame before the next scene, where its analysed range starts
+    start_idx = completed_scenes[-1]['end_frame'] - 1 if completed_scenes else 0
     
-    # Step 2: Detect video scenes
-    print_step(2, "Scene detection")
-    scenes_info = find_and_split_scenes(mxf_file_path, video_info['frame_rate'])
+    # Selected sequences are cached at full resolution while their frames are still decoded
+    frame_cache = None
+    if FRAME_CACHE['enabled']:
+        if not completed:
+            clear_frame_cache(mxf_file_path)
+        if not scene_parallel:
+            frame_cache = FrameCacheWriter(mxf_file_path, get_frame_pool_size() + QUALITY_ANALYSIS['batch_size'])
     
-    # Step 3: Initialize quality analysis models
-    print_step(3, "Quality-based frame analysis per scene")
-    musiq_metric, niqe_metric, device = initialize_quality_metrics(DEVICE)
+    # Step 1: Open MXF video as a lazy 720p frame stream (seeking past finished scenes)
+    print_step(1, "Reading MXF file and converting frames")
+    frame_source, video_info = read_mxf_video(mxf_file_path, start_idx, frame_cache)
     
-    # Step 4: Analyze frame quality per scene
-    base_video_name = get_base_filename(mxf_file_path)
-    if QUALITY_ANALYSIS['use_musiq']:
-        scene_results = find_sequence_per_scene(frames_list, scenes_info, base_video_name, musiq_metric, niqe_metric, device)
+    # Step 2: Initialize quality analysis models (scene workers load their own)
+    print_step(2, "Loading quality models")
+    if quality_metrics is None and not scene_parallel:
+        quality_metrics = initialize_quality_metrics(DEVICE, use_musiq=QUALITY_ANALYSIS['use_musiq'])
+    
+    if scene_parallel:
+        # Step 3: Detect every scene first, then score scene ranges on a pool of seeking decoders
+        print_step(3, "Scene detection, then parallel quality-based frame analysis per scene")
+        try:
+            scenes_info = find_and_split_scenes(frame_source, video_info['frame_rate'], mxf_file_path)
+        finally:
+            frame_source.close()
+        scene_results = analyze_scenes_in_parallel(mxf_file_path, scenes_info, base_video_name, score_store, prefilter, should_abort)
     else:
-        scene_results = find_sequences_per_scene_niqe_only(frames_list, scenes_info, base_video_name, niqe_metric, device)
+        # Step 3: Detect scenes and analyze frame quality in a single decode pass
+        print_step(3, "Scene detection and quality-based frame analysis per scene")
+        musiq_metric, niqe_metric, device = quality_metrics
+        
+        # A scene list cached by an earlier run of this file and settings replaces detection
+        cached_scenes = load_cached_scenes(mxf_file_path) if SCENE_CACHE['enabled'] else None
+        known_cuts = None
+        if cached_scenes is not None and cached_scenes[:len(completed_scenes)] == completed_scenes:
+            known_cuts = [scene['start_frame'] for scene in cached_scenes[1:]]
+        scene_splitter = SceneSplitter(video_info['frame_rate'], completed_scenes, on_scene_finished=journal.record_scene,
+                                       video_path=mxf_file_path, known_cuts=known_cuts)
+        frames = frame_source.iter_range(start_idx)
+        frame_reader = None
+        
+        # Threaded mode decodes ahead of scoring
+        if PIPELINE['mode'] == 'threaded':
+            frames = frame_reader = ThreadedFrameReader(frames)
+        
+        def record_result(scene_result):
+            # Stop before the journal records a scene another worker may be analysing too
+            check_abort()
+            if frame_cache is not None:
+                frame_cache.cache_sequence(scene_result)
+            journal.record_result(scene_result)
+        
+        hold_frames = frame_cache.hold_frames if frame_cache is not None else None
+        scene_frames = scene_splitter.iter_scenes(frames)
+        try:
+            if QUALITY_ANALYSIS['use_musiq']:
+                scene_results = find_sequence_per_scene(scene_frames, base_video_name, musiq_metric, niqe_metric, device, score_store, record_result, prefilter, hold_frames)
+            else:
+                scene_results = find_sequences_per_scene_niqe_only(scene_frames, base_video_name, niqe_metric, device, score_store, record_result, prefilter, hold_frames)
+        finally:
+            if frame_reader is not None:
+                frame_reader.close()
+            journal.close()
+            frame_source.close()
+        scene_results = [entry['result'] for entry in completed] + scene_results
+        scenes_info = scene_splitter.scenes_info
+        if SCENE_CACHE['enabled'] and known_cuts is None:
+            save_cached_scenes(mxf_file_path, scenes_info)
     
-    # Step 5: Save results
+    # Step 4: Save results
+    check_abort()
     print_step(4, "Saving analysis results")
     json_output_path = os.path.join(output_folder, f"{base_video_name}_analysis.json")
-    analysis_data = save_analysis_json(video_info, scenes_info, scene_results, json_output_path)
+    analysis_data = save_analysis_json(video_info, scenes_info, scene_results, json_output_path, prefilter.get_stats())
+    if score_store is not None:
+        score_store.save(get_scores_path(output_folder, base_video_name))
+    if SCENE_DEDUP['enabled']:
+        # Later movies match their scenes against this one
+        save_scene_index(base_video_name, scenes_info, scene_results)
+    if FRAME_CACHE['enabled']:
+        save_frame_cache_index(mxf_file_path, scene_results)
+    stage_profiler.save_report(output_folder, base_video_name)
     
     # Final summary
     sequences_found = sum(1 for sr in scene_results if sr['sequence_found'])
@@ -50,26 +147,29 @@ def process_mxf_complete_pipeline(mxf_file_path, output_folder):
     return analysis_data
 
 if __name__ == "__main__":
-    mxf_folder = "movie"
-    output_folder = "analysis_results"
-        
-    mxf_files_to_process = [f for f in os.listdir(mxf_folder) ]
+    parser = argparse.ArgumentParser(description="Analyze every movie in the movie folder")
+    parser.add_argument('--movie-folder', default="movie", help="folder of movies to analyze")
+    parser.add_argument('--output-folder', default="analysis_results", help="folder for analysis results, leases and the status report")
+    parser.add_argument('--work-queue', action='store_true', help="run one lease-based work queue worker (as WORK_QUEUE['enabled'])")
+    parser.add_argument('--profile', action='store_true', help="run under cProfile/tracemalloc and dump the results into the output folder")
+    parser.add_argument('--no-color', action='store_true', help="print without ANSI colours")
+    args = parser.parse_args()
+    if args.no_color:
+        # Read by the worker processes, which start with colours on
+        PROFILING['color_output'] = False
+    if not PROFILING['color_output']:
+        disable_color()
+    mxf_folder = args.movie_folder
+    output_folder = args.output_folder
     
-    if not mxf_files_to_process:
-        print(f"{Fore.YELLOW}No .mxf files found in the '{mxf_folder}' directory.{Style.RESET_ALL}")
+    if WORK_QUEUE['enabled'] or args.work_queue:
+        # Claim titles through lease files so several nodes can share the folders
+        run = run_worker
     else:
-        print(f"Found {len(mxf_files_to_process)} MXF files to process.\n")
-        
-        for filename in mxf_files_to_process:
-            base_name = os.path.splitext(filename)[0]
-            expected_output_file = os.path.join(output_folder, f"{base_name}_analysis.json")
-            
-            if os.path.exists(expected_output_file):
-                print(f"{Fore.YELLOW}⏩ Skipping '{filename}': Analysis file already exists.{Style.RESET_ALL}")
-                continue
-            
-            print(f"{Fore.CYAN}{'-'*80}{Style.RESET_ALL}")
-            mxf_file_path = os.path.join(mxf_folder, filename)
-            analysis_data = process_mxf_complete_pipeline(mxf_file_path, output_folder)
-
-        print_header("✅ ALL FILES PROCESSED")
\ No newline at end of file
+        # Titles are spread over BATCH_PROCESSING['workers'] processes that keep their models loaded
+        run = run_batch
+    
+    if args.profile:
+        run_profiled(run, output_folder, mxf_folder, output_folder)
+    else:
+        run(mxf_folder, output_folder)
\ No newline at end of file
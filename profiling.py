@@ -0,0 +1,196 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from config import OUTPUT, PROFILING
+from utils import ensure_directory, print_info, print_success
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+_NO_STAGE = nullcontext()
+
+def get_peak_rss_bytes():
+    """Get the peak resident set size of this process so far, or None where unsupported"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class _StageTimer:
+    """Context manager adding one timed call to a stage"""
+    
+    __slots__ = ('_profiler', '_name', '_items', '_wall', '_cpu')
+    
+    def __init__(self, profiler, name, items):
+        self._profiler = profiler
+        self._name = name
+        self._items = items
+    
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._profiler.add(self._name, time.perf_counter() - self._wall, time.thread_time() - self._cpu, self._items)
+        return False
+
+class StageProfiler:
+    """Per-stage wall time, CPU time (of the thread running the stage) and item counts for one movie"""
+    
+    def __init__(self, enabled=PROFILING['enabled']):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """Start a fresh report, e.g. for the next movie"""
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+            self._started = time.perf_counter()
+    
+    def stage(self, name, items=0):
+        """Time a block as one call of a stage that handled items frames"""
+        return _StageTimer(self, name, items) if self.enabled else _NO_STAGE
+    
+    def add(self, name, wall_seconds, cpu_seconds, items=0, calls=1):
+        with self._lock:
+            stage = self._stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'calls': 0, 'items': 0})
+            stage['wall_seconds'] += wall_seconds
+            stage['cpu_seconds'] += cpu_seconds
+            stage['calls'] += calls
+            stage['items'] += items
+    
+    def count(self, name, amount=1):
+        """Increase a counter such as the number of metric calls"""
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + amount
+    
+    def merge(self, report):
+        """Add the stages and counters of a report made in another worker process"""
+        for name, stage in report['stages'].items():
+            self.add(name, stage['wall_seconds'], stage['cpu_seconds'], stage['items'], stage['calls'])
+        for name, amount in report['counters'].items():
+            self.count(name, amount)
+    
+    def get_report(self, movie_name=None):
+        """Summarize all stages with their throughput"""
+        with self._lock:
+            stages = {}
+            for name, stage in sorted(self._stages.items(), key=lambda item: -item[1]['wall_seconds']):
+                stages[name] = dict(stage)
+                stages[name]['items_per_second'] = round(stage['items'] / stage['wall_seconds'], 2) if stage['wall_seconds'] > 0 else None
+            report = {
+                'movie': movie_name,
+                'total_wall_seconds': round(time.perf_counter() - self._started, 3),
+                'peak_rss_bytes': get_peak_rss_bytes(),
+                'stages': stages,
+                'counters': dict(self._counters)
+            }
+            # Large frame/batch buffers allocated per converted frame; near 0 once pools are warm
+            frames_converted = self._stages.get('reformat_720p', {}).get('items')
+            if frames_converted and 'buffer_allocations' in self._counters:
+                report['buffer_allocations_per_frame'] = round(self._counters['buffer_allocations'] / frames_converted, 4)
+            return report
+    
+    def save_report(self, output_folder, movie_name):
+        """Write the report as JSON into the output folder's report folder, plus a Prometheus textfile if configured"""
+        if not self.enabled:
+            return None
+        report = self.get_report(movie_name)
+        # Kept out of the output folder itself, which the extractors scan for analysis JSON files
+        report_path = os.path.join(output_folder, PROFILING['report_folder'], f"{movie_name}{PROFILING['report_suffix']}")
+        ensure_directory(report_path)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=OUTPUT['json_indent'])
+        
+        if PROFILING['prometheus_textfile_dir']:
+            write_prometheus_textfile(report, PROFILING['prometheus_textfile_dir'])
+        self.print_summary(report)
+        return report_path
+    
+    def print_summary(self, report):
+        """Print the slowest stages"""
+        print_info(f"Stage timings ({report['total_wall_seconds']}s total):")
+        for name, stage in list(report['stages'].items())[:8]:
+            rate = f", {stage['items_per_second']} frames/s" if stage['items'] and stage['items_per_second'] else ""
+            print(f"   {name:<20} {stage['wall_seconds']:9.2f}s wall {stage['cpu_seconds']:9.2f}s cpu{rate}")
+        if 'buffer_allocations_per_frame' in report:
+            print(f"   buffer allocations   {report['counters']['buffer_allocations']} ({report['buffer_allocations_per_frame']} per frame)")
+
+def _prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def write_prometheus_textfile(report, textfile_dir):
+    """Write a report in the node_exporter textfile-collector format (renamed into place atomically)"""
+    movie = _prometheus_label(report['movie'])
+    lines = [
+        "# TYPE vsr_pipeline_stage_wall_seconds gauge",
+        "# TYPE vsr_pipeline_stage_cpu_seconds gauge",
+        "# TYPE vsr_pipeline_stage_items gauge",
+        "# TYPE vsr_pipeline_counter gauge",
+        "# TYPE vsr_pipeline_peak_rss_bytes gauge",
+        "# TYPE vsr_pipeline_wall_seconds gauge"
+    ]
+    for name, stage in report['stages'].items():
+        labels = f'movie="{movie}",stage="{_prometheus_label(name)}"'
+        lines.append(f"vsr_pipeline_stage_wall_seconds{{{labels}}} {stage['wall_seconds']:.6f}")
+        lines.append(f"vsr_pipeline_stage_cpu_seconds{{{labels}}} {stage['cpu_seconds']:.6f}")
+        lines.append(f"vsr_pipeline_stage_items{{{labels}}} {stage['items']}")
+    for name, amount in report['counters'].items():
+        lines.append(f'vsr_pipeline_counter{{movie="{movie}",name="{_prometheus_label(name)}"}} {amount}')
+    if report['peak_rss_bytes'] is not None:
+        lines.append(f'vsr_pipeline_peak_rss_bytes{{movie="{movie}"}} {report["peak_rss_bytes"]}')
+    lines.append(f'vsr_pipeline_wall_seconds{{movie="{movie}"}} {report["total_wall_seconds"]}')
+    
+    os.makedirs(textfile_dir, exist_ok=True)
+    textfile_path = os.path.join(textfile_dir, f"vsr_pipeline_{os.getpid()}.prom")
+    with open(textfile_path + '.tmp', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(textfile_path + '.tmp', textfile_path)
+    return textfile_path
+
+def run_profiled(function, output_folder, *args, **kwargs):
+    """Run a function under cProfile and tracemalloc, dumping call stats and top allocations
+    
+    Only this process is profiled; pool workers are not.
+    """
+    tracemalloc.start()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        
+        os.makedirs(output_folder, exist_ok=True)
+        stats_path = os.path.join(output_folder, PROFILING['cprofile_file'])
+        profile.dump_stats(stats_path)
+        
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(40)
+        summary.write("\nTop allocations (tracemalloc):\n")
+        for statistic in snapshot.statistics('lineno')[:25]:
+            summary.write(f"{statistic}\n")
+        summary_path = os.path.join(output_folder, PROFILING['profile_summary_file'])
+        with open(summary_path, 'w') as f:
+            f.write(summary.getvalue())
+        print_success(f"Profile written to {stats_path} and {summary_path}")
+
+# Shared by every instrumented module in this process
+stage_profiler = StageProfiler()
\ No newline at end of file
@@ -1,11 +1,13 @@
-import cv2
 import torch
 import pyiqa
 import numpy as np
 from collections import deque
 from tqdm import tqdm
 from colorama import Fore
-from config import QUALITY_ANALYSIS
+from config import QUALITY_ANALYSIS, SCENE_DEDUP, SCORE_STORE
+from frame_preprocessor import compute_frame_std, compact_frames, convert_yuv420_to_rgb
+from profiling import stage_profiler
+from scene_index import SceneDeduplicator, format_scene_hash
 from utils import get_device, print_processing, print_success, print_warning, print_info
 
 def initialize_quality_metrics(device_preference='auto', use_musiq=True):
@@ -23,65 +25,288 @@ def initialize_quality_metrics(device_preference='auto', use_musiq=True):
     
     return musiq_metric, niqe_metric, device
 
-def find_sequence_per_scene(frames_list, scenes_info, base_video_name, musiq_metric, niqe_metric, device):
-    """Find high-quality frame sequences in each detected scene"""
+class BatchScorer:
+    """Gate, convert and score frames in batches through reused, pre-allocated (pinned on CUDA) buffers"""
+    
+    def __init__(self, metrics, device, batch_size=QUALITY_ANALYSIS['batch_size'], score_store=None, prefilter=None):
+        self.metrics = metrics
+        self.device = device
+        self.score_store = score_store
+        self.prefilter = prefilter
+        self.batch_size = max(batch_size, 1)
+        self.metric_evaluations = 0
+        self._yuv_block = None
+        self._chroma = None
+        self._host_batch = None
+        self._device_batch = None
+    
+    def iter_scores(self, frames):
+        """Yield (frame_number, scores) in frame order; scores is None for skipped frames"""
+        frame_numbers = []
+        
+        for frame_idx, frame_array in frames:
+            self._load_frame(len(frame_numbers), frame_array)
+            frame_numbers.append(frame_idx + 1)
+            
+            if len(frame_numbers) == self.batch_size:
+                yield from zip(frame_numbers, self._score_block(frame_numbers))
+                frame_numbers = []
+        
+        yield from zip(frame_numbers, self._score_block(frame_numbers))
+    
+    def score_frames(self, frame_items):
+        """Score a list of (frame_number, frame_array) items; returns scores (or None) per item"""
+        scores = []
+        for start in range(0, len(frame_items), self.batch_size):
+            chunk = frame_items[start:start + self.batch_size]
+            for slot, (_frame_number, frame_array) in enumerate(chunk):
+                self._load_frame(slot, frame_array)
+            scores.extend(self._score_block([frame_number for frame_number, _ in chunk]))
+        return scores
+    
+    def count_passing(self, frame_arrays):
+        """Count the frames the variance gate and prefilter would pass to the metrics, without scoring them"""
+        frames_yuv = np.stack(frame_arrays)
+        with stage_profiler.stage('variance_gate', items=len(frames_yuv)):
+            keep = np.flatnonzero(compute_frame_std(frames_yuv) >= QUALITY_ANALYSIS['min_frame_variance'])
+        if self.prefilter is not None:
+            keep = self.prefilter.filter(frames_yuv, keep)
+        return len(keep)
+    
+    def _load_frame(self, slot, frame_yuv):
+        """Copy a yuv420p frame into a slot of the stacked uint8 batch block"""
+        if self._yuv_block is None or self._yuv_block.shape[1:] != frame_yuv.shape:
+            self._allocate(frame_yuv.shape)
+        self._yuv_block[slot] = frame_yuv
+    
+    def _allocate(self, frame_shape):
+        """Allocate the reused batch buffers for a yuv420p frame shape"""
+        rows, width = frame_shape
+        height = rows * 2 // 3
+        pin_memory = self.device.type == 'cuda'
+        self._yuv_block = np.empty((self.batch_size, rows, width), dtype=np.uint8)
+        self._chroma = torch.empty((self.batch_size, 2, height // 2, width // 2), dtype=torch.float32)
+        self._host_batch = torch.empty((self.batch_size, 3, height, width), dtype=torch.float32, pin_memory=pin_memory)
+        self._device_batch = self._host_batch
+        stage_profiler.count('buffer_allocations', 3)
+        if pin_memory:
+            self._device_batch = torch.empty((self.batch_size, 3, height, width), dtype=torch.float32, device=self.device)
+            stage_profiler.count('buffer_allocations')
+    
+    def _score_block(self, frame_numbers):
+        """Gate, convert and score the filled block; returns scores (or None) in frame order"""
+        count = len(frame_numbers)
+        if not count:
+            return []
+        frames_yuv = self._yuv_block[:count]
+        
+        # Drop low-variance frames (likely blank/black) before paying for conversion
+        with stage_profiler.stage('variance_gate', items=count):
+            frame_std = compute_frame_std(frames_yuv)
+            keep = np.flatnonzero(frame_std >= QUALITY_ANALYSIS['min_frame_variance'])
+        if self.prefilter is not None:
+            with stage_profiler.stage('prefilter', items=count):
+                keep = self.prefilter.apply(frames_yuv, frame_std, keep)
+        
+        scores = {}
+        if len(keep):
+            with stage_profiler.stage('yuv_to_rgb', items=len(keep)):
+                compact_frames(frames_yuv, keep)
+                host_batch = convert_yuv420_to_rgb(frames_yuv[:len(keep)], self._host_batch[:len(keep)], self._chroma[:len(keep)])
+                batch = host_batch
+                # Slices are new views each time, so compare the buffers they come from
+                if self._device_batch is not self._host_batch:
+                    batch = self._device_batch[:len(keep)]
+                    batch.copy_(host_batch, non_blocking=True)
+            for name, metric in self.metrics.items():
+                with stage_profiler.stage(name, items=len(keep)):
+                    scores[name] = self._run_metric(metric, batch, len(keep))
+            self.metric_evaluations += len(keep)
+        
+        slots = {position: slot for slot, position in enumerate(keep.tolist())}
+        block_scores = []
+        for position, frame_number in enumerate(frame_numbers):
+            slot = slots.get(position)
+            frame_scores = None
+            if slot is not None:
+                frame_scores = {name: values[slot] for name, values in scores.items()}
+            
+            # Record the whole block before the consumer can stop early
+            if self.score_store is not None:
+                self.score_store.add(frame_number, frame_std[position], frame_scores)
+            
+            if frame_scores is not None and None in frame_scores.values():
+                frame_scores = None
+            block_scores.append(frame_scores)
+        
+        return block_scores
+    
+    def _run_metric(self, metric, batch, count):
+        """Score a whole batch at once, falling back to per-frame scoring if the batch fails"""
+        with torch.no_grad():
+            try:
+                stage_profiler.count('metric_calls')
+                values = metric(batch).flatten().tolist()
+                if len(values) == count:
+                    return values
+            except Exception:
+                pass
+            
+            # Score frames individually so a failing frame is skipped on its own
+            values = []
+            for slot in range(count):
+                try:
+                    stage_profiler.count('metric_calls')
+                    values.append(metric(batch[slot:slot + 1]).item())
+                except Exception:
+                    values.append(None)
+            return values
+
+def meets_quality_thresholds(scores):
+    """Check whether a frame's MUSIQ and NIQE scores meet the configured thresholds"""
+    return (scores['musiq'] >= QUALITY_ANALYSIS['musiq_threshold']) and (scores['niqe'] <= QUALITY_ANALYSIS['niqe_threshold'])
+
+def meets_niqe_threshold(scores):
+    """Check whether a frame's NIQE score meets the configured threshold"""
+    return scores['niqe'] <= QUALITY_ANALYSIS['niqe_threshold']
+
+def find_sequence_coarse_to_fine(scorer, frames, is_good_quality):
+    """Find the first run of sequence_length good frames, probing sparsely and verifying candidates
+    
+    Only the last frame of each candidate window is scored first (a stride of sequence_length
+    frames); if it fails, no window containing it can succeed and the whole window is skipped.
+    Otherwise the rest of the window is scored and checked from the back, and the search restarts
+    just after the latest failing frame. This returns exactly the run the exhaustive search finds,
+    while only the last sequence_length frames are ever kept for look-back.
+    
+    evaluations_saved counts the skipped frames that pass the variance gate and prefilter,
+    i.e. the metric evaluations the exhaustive search would have spent on top.
+    """
+    sequence_length = QUALITY_ANALYSIS['sequence_length']
+    recent_frames = deque(maxlen=sequence_length)
+    known_quality = {}
+    scored_frames = set()
+    unscored_passing = 0
+    candidate_start = None
+    frames_considered = 0
+    evaluations_before = scorer.metric_evaluations
+    selected_frames = []
+    
+    def evaluate(frame_items):
+        scored_frames.update(frame_number for frame_number, _ in frame_items)
+        for (frame_number, _), scores in zip(frame_items, scorer.score_frames(frame_items)):
+            known_quality[frame_number] = scores is not None and is_good_quality(scores)
+    
+    for frame_idx, frame_array in frames:
+        frame_number = frame_idx + 1
+        frames_considered += 1
+        # Gate a frame that leaves the look-back unscored while its (pooled) array is still valid
+        if len(recent_frames) == sequence_length and recent_frames[0][0] not in scored_frames:
+            unscored_passing += scorer.count_passing([recent_frames[0][1]])
+        recent_frames.append((frame_number, frame_array))
+        if candidate_start is None:
+            candidate_start = frame_number
+        if frame_number != candidate_start + sequence_length - 1:
+            continue
+        
+        # Coarse: a failing last frame rules out every window that contains it
+        if frame_number not in known_quality:
+            evaluate([(frame_number, frame_array)])
+        if not known_quality[frame_number]:
+            candidate_start = frame_number + 1
+            known_quality.clear()
+            continue
+        
+        # Fine: score the unverified rest of the window in one batch, then scan it from the back
+        evaluate([item for item in recent_frames if item[0] >= candidate_start and item[0] not in known_quality])
+        failed = [n for n in range(candidate_start, frame_number) if not known_quality[n]]
+        if not failed:
+            selected_frames = list(range(candidate_start, frame_number + 1))
+            break
+        candidate_start = failed[-1] + 1
+        known_quality = {n: good for n, good in known_quality.items() if n >= candidate_start}
+    
+    unscored_frames = [frame_array for frame_number, frame_array in recent_frames if frame_number not in scored_frames]
+    if unscored_frames:
+        unscored_passing += scorer.count_passing(unscored_frames)
+    search_stats = {
+        'strategy': 'coarse_to_fine',
+        'frames_considered': frames_considered,
+        'metric_evaluations': scorer.metric_evaluations - evaluations_before,
+        'evaluations_saved': unscored_passing
+    }
+    return selected_frames, search_stats
+
+def find_sequence_per_scene(scene_frames, base_video_name, musiq_metric, niqe_metric, device, score_store=None, on_scene_result=None, prefilter=None, on_sequence_selected=None):
+    """Find high-quality frame sequences in each detected scene
+    
+    scene_frames yields (scene, frames) pairs where frames lazily yields (frame_idx, frame_array).
+    Every scored frame is recorded in score_store when one is given, and on_scene_result
+    is called with each scene result as soon as its scene is finished. on_sequence_selected is
+    called with the selected frame numbers when a selection is made before the scene's last
+    frame is read. A PrefilterCascade rejects obviously unusable frames before the metrics run.
+    With SCENE_DEDUP enabled, scenes that duplicate a scene of another analysed movie are not scored.
+    """
     scene_results = []
+    scorer = BatchScorer({'musiq': musiq_metric, 'niqe': niqe_metric}, device, score_store=score_store, prefilter=prefilter)
+    deduplicator = SceneDeduplicator(base_video_name) if SCENE_DEDUP['enabled'] else None
     
     print_processing("Starting quality analysis per scene...")
     print(f"{Fore.CYAN}   Thresholds: MUSIQ > {QUALITY_ANALYSIS['musiq_threshold']}, NIQE < {QUALITY_ANALYSIS['niqe_threshold']}")
-    print(f"{Fore.CYAN}   Target sequence length: {QUALITY_ANALYSIS['sequence_length']} frames")
+    print(f"{Fore.CYAN}   Target sequence length: {QUALITY_ANALYSIS['sequence_length']} frames (batch size: {scorer.batch_size})")
     
     # Process each scene individually
-    for scene in tqdm(scenes_info, desc="Analyzing scenes", unit="scene", colour="magenta"):
+    for scene, frames in tqdm(scene_frames, desc="Analyzing scenes", unit="scene", colour="magenta"):
         scene_id = scene['scene_id']
         start_frame = scene['start_frame']
-        end_frame = scene['end_frame']
         
-        print_info(f"Processing Scene {scene_id} (frames {start_frame}-{end_frame})")
+        # The scene's end is only known once its frames have been read
+        print_info(f"Processing Scene {scene_id} (from frame {start_frame})")
+        
+        # Scenes already analysed in another movie are taken over instead of scored
+        scene_hash = None
+        if deduplicator is not None:
+            frames, scene_hash = deduplicator.hash_scene(scene, frames)
+            duplicate_result = deduplicator.match_scene(scene, frames, scene_hash, on_sequence_selected)
+            if duplicate_result is not None:
+                scene_results.append(duplicate_result)
+                if on_scene_result is not None:
+                    on_scene_result(duplicate_result)
+                continue
         
         frame_buffer = deque(maxlen=QUALITY_ANALYSIS['sequence_length'])
         selected_frames = []
         
-        # Analyze frames within current scene
-        for frame_idx in range(start_frame - 1, min(end_frame, len(frames_list))):
-            frame_array = frames_list[frame_idx]
-            frame_number = frame_idx + 1
-            
-            # Skip low-variance frames (likely blank/black)
-            if np.std(frame_array) < QUALITY_ANALYSIS['min_frame_variance']:
-                frame_buffer.clear()
-                continue
-            
-            # Convert frame for quality analysis
-            frame_bgr = cv2.cvtColor(frame_array, cv2.COLOR_YUV2BGR_I420)
-            frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-            frame_tensor = torch.tensor(frame_rgb).permute(2, 0, 1).unsqueeze(0) / 255.0
-            frame_tensor = frame_tensor.to(device)
-            
-            # Calculate quality metrics with error handling for NIQE
-            with torch.no_grad():
-                musiq_score = musiq_metric(frame_tensor).item()
-                
-                # Try NIQE calculation, skip frame if it fails
-                try:
-                    niqe_score = niqe_metric(frame_tensor).item()
-                except:
-                    # Skip this frame if NIQE calculation fails
+        search_stats = None
+        if QUALITY_ANALYSIS['search_strategy'] == 'coarse_to_fine':
+            # Score a sparse subsample first and verify only candidate windows
+            selected_frames, search_stats = find_sequence_coarse_to_fine(scorer, frames, meets_quality_thresholds)
+        else:
+            # Analyze frames within current scene (decoded on demand, scored in batches)
+            scored_frames = scorer.iter_scores(frames)
+            for frame_number, scores in scored_frames:
+                # Skip blank frames and frames the metrics could not score
+                if scores is None:
                     frame_buffer.clear()
                     continue
-            
-            # Check if frame meets quality thresholds
-            is_good_quality = (musiq_score >= QUALITY_ANALYSIS['musiq_threshold']) and (niqe_score <= QUALITY_ANALYSIS['niqe_threshold'])
-            
-            if is_good_quality:
-                frame_buffer.append(frame_number)
-            else:
-                frame_buffer.clear()
-            
-            # Check if we found a complete sequence
-            if len(frame_buffer) == QUALITY_ANALYSIS['sequence_length']:
-                selected_frames = list(frame_buffer)
-                break
+                
+                # Check if frame meets quality thresholds
+                is_good_quality = meets_quality_thresholds(scores)
+                
+                if is_good_quality:
+                    frame_buffer.append(frame_number)
+                else:
+                    frame_buffer.clear()
+                
+                # Check if we found a complete sequence (optionally keep scoring for the store)
+                if len(frame_buffer) == QUALITY_ANALYSIS['sequence_length'] and not selected_frames:
+                    selected_frames = list(frame_buffer)
+                    if score_store is None or not SCORE_STORE['score_full_scenes']:
+                        break
+                    # The rest of the scene is still scored for the store
+                    if on_sequence_selected is not None:
+                        on_sequence_selected(selected_frames)
+            scored_frames.close()
         
         # Store results for current scene
         success = len(selected_frames) == QUALITY_ANALYSIS['sequence_length']
@@ -91,6 +316,12 @@ def find_sequence_per_scene(frames_list, scenes_info, base_video_name, musiq_met
             'selected_frames': selected_frames,
             'total_frames_selected': len(selected_frames)
         }
+        if scene_hash is not None:
+            scene_result['scene_hash'] = format_scene_hash(scene_hash)
+        if search_stats is not None:
+            scene_result['search_stats'] = search_stats
+            print_info(f"Scene {scene_id}: {search_stats['metric_evaluations']} metric evaluations "
+                       f"for {search_stats['frames_considered']} frames ({search_stats['evaluations_saved']} saved)")
         
         if success:
             print_success(f"Scene {scene_id}: Found {QUALITY_ANALYSIS['sequence_length']} consecutive high-quality frames")
@@ -98,66 +329,81 @@ def find_sequence_per_scene(frames_list, scenes_info, base_video_name, musiq_met
             print_warning(f"Scene {scene_id}: Only found {len(selected_frames)} quality frames")
         
         scene_results.append(scene_result)
+        if on_scene_result is not None:
+            on_scene_result(scene_result)
     
     return scene_results
 
-def find_sequences_per_scene_niqe_only(frames_list, scenes_info, base_video_name, niqe_metric, device):
-    """Find high-quality frame sequences in each detected scene using only NIQE threshold"""
+def find_sequences_per_scene_niqe_only(scene_frames, base_video_name, niqe_metric, device, score_store=None, on_scene_result=None, prefilter=None, on_sequence_selected=None):
+    """Find high-quality frame sequences in each detected scene using only NIQE threshold
+    
+    scene_frames yields (scene, frames) pairs where frames lazily yields (frame_idx, frame_array).
+    Every scored frame is recorded in score_store when one is given, and on_scene_result
+    is called with each scene result as soon as its scene is finished. on_sequence_selected is
+    called with the selected frame numbers when a selection is made before the scene's last
+    frame is read. A PrefilterCascade rejects obviously unusable frames before the metrics run.
+    With SCENE_DEDUP enabled, scenes that duplicate a scene of another analysed movie are not scored.
+    """
     scene_results = []
+    scorer = BatchScorer({'niqe': niqe_metric}, device, score_store=score_store, prefilter=prefilter)
+    deduplicator = SceneDeduplicator(base_video_name) if SCENE_DEDUP['enabled'] else None
     
     print_processing("Starting NIQE-only quality analysis per scene...")
     print(f"{Fore.CYAN}   Threshold: NIQE < {QUALITY_ANALYSIS['niqe_threshold']}")
-    print(f"{Fore.CYAN}   Target sequence length: {QUALITY_ANALYSIS['sequence_length']} frames")
+    print(f"{Fore.CYAN}   Target sequence length: {QUALITY_ANALYSIS['sequence_length']} frames (batch size: {scorer.batch_size})")
     
     # Process each scene individually
-    for scene in tqdm(scenes_info, desc="Analyzing scenes (NIQE-only)", unit="scene", colour="magenta"):
+    for scene, frames in tqdm(scene_frames, desc="Analyzing scenes (NIQE-only)", unit="scene", colour="magenta"):
         scene_id = scene['scene_id']
         start_frame = scene['start_frame']
-        end_frame = scene['end_frame']
         
-        print_info(f"Processing Scene {scene_id} (frames {start_frame}-{end_frame}) - NIQE only")
+        # The scene's end is only known once its frames have been read
+        print_info(f"Processing Scene {scene_id} (from frame {start_frame}) - NIQE only")
+        
+        # Scenes already analysed in another movie are taken over instead of scored
+        scene_hash = None
+        if deduplicator is not None:
+            frames, scene_hash = deduplicator.hash_scene(scene, frames)
+            duplicate_result = deduplicator.match_scene(scene, frames, scene_hash, on_sequence_selected)
+            if duplicate_result is not None:
+                scene_results.append(duplicate_result)
+                if on_scene_result is not None:
+                    on_scene_result(duplicate_result)
+                continue
         
         frame_buffer = deque(maxlen=QUALITY_ANALYSIS['sequence_length'])
         selected_frames = []
         
-        # Analyze frames within current scene
-        for frame_idx in range(start_frame - 1, min(end_frame, len(frames_list))):
-            frame_array = frames_list[frame_idx]
-            frame_number = frame_idx + 1
-            
-            # Skip low-variance frames (likely blank/black)
-            if np.std(frame_array) < QUALITY_ANALYSIS['min_frame_variance']:
-                frame_buffer.clear()
-                continue
-            
-            # Convert frame for quality analysis
-            frame_bgr = cv2.cvtColor(frame_array, cv2.COLOR_YUV2BGR_I420)
-            frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-            frame_tensor = torch.tensor(frame_rgb).permute(2, 0, 1).unsqueeze(0) / 255.0
-            frame_tensor = frame_tensor.to(device)
-            
-            # Calculate only NIQE quality metric with error handling
-            with torch.no_grad():
-                # Try NIQE calculation, skip frame if it fails
-                try:
-                    niqe_score = niqe_metric(frame_tensor).item()
-                except:
-                    # Skip this frame if NIQE calculation fails
+        search_stats = None
+        if QUALITY_ANALYSIS['search_strategy'] == 'coarse_to_fine':
+            # Score a sparse subsample first and verify only candidate windows
+            selected_frames, search_stats = find_sequence_coarse_to_fine(scorer, frames, meets_niqe_threshold)
+        else:
+            # Analyze frames within current scene (decoded on demand, scored in batches)
+            scored_frames = scorer.iter_scores(frames)
+            for frame_number, scores in scored_frames:
+                # Skip blank frames and frames NIQE could not score
+                if scores is None:
                     frame_buffer.clear()
                     continue
-            
-            # Check if frame meets NIQE quality threshold only
-            is_good_quality = niqe_score <= QUALITY_ANALYSIS['niqe_threshold']
-            
-            if is_good_quality:
-                frame_buffer.append(frame_number)
-            else:
-                frame_buffer.clear()
-            
-            # Check if we found a complete sequence
-            if len(frame_buffer) == QUALITY_ANALYSIS['sequence_length']:
-                selected_frames = list(frame_buffer)
-                break
+                
+                # Check if frame meets NIQE quality threshold only
+                is_good_quality = meets_niqe_threshold(scores)
+                
+                if is_good_quality:
+                    frame_buffer.append(frame_number)
+                else:
+                    frame_buffer.clear()
+                
+                # Check if we found a complete sequence (optionally keep scoring for the store)
+                if len(frame_buffer) == QUALITY_ANALYSIS['sequence_length'] and not selected_frames:
+                    selected_frames = list(frame_buffer)
+                    if score_store is None or not SCORE_STORE['score_full_scenes']:
+                        break
+                    # The rest of the scene is still scored for the store
+                    if on_sequence_selected is not None:
+                        on_sequence_selected(selected_frames)
+            scored_frames.close()
         
         # Store results for current scene
         success = len(selected_frames) == QUALITY_ANALYSIS['sequence_length']
@@ -167,6 +413,12 @@ def find_sequences_per_scene_niqe_only(frames_list, scenes_info, base_video_name
             'selected_frames': selected_frames,
             'total_frames_selected': len(selected_frames)
         }
+        if scene_hash is not None:
+            scene_result['scene_hash'] = format_scene_hash(scene_hash)
+        if search_stats is not None:
+            scene_result['search_stats'] = search_stats
+            print_info(f"Scene {scene_id}: {search_stats['metric_evaluations']} metric evaluations "
+                       f"for {search_stats['frames_considered']} frames ({search_stats['evaluations_saved']} saved)")
         
         if success:
             print_success(f"Scene {scene_id}: Found {QUALITY_ANALYSIS['sequence_length']} consecutive high-quality frames (NIQE-only)")
@@ -174,5 +426,7 @@ def find_sequences_per_scene_niqe_only(frames_list, scenes_info, base_video_name
             print_warning(f"Scene {scene_id}: Only found {len(selected_frames)} quality frames (NIQE-only)")
         
         scene_results.append(scene_result)
+        if on_scene_result is not None:
+            on_scene_result(scene_result)
     
     return scene_results
\ No newline at end of file
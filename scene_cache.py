@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import scenedetect
+from colorama import Fore
+from config import OUTPUT, SCENE_CACHE, SCENE_DETECTION, VIDEO_CONVERSION
+from utils import print_info, print_success
+
+# Settings that only decide where detection inputs are cached do not change the scene list
+IGNORED_DETECTION_SETTINGS = ('proxy_cache_folder',)
+
+def get_sampled_file_hash(file_path, sample_blocks=SCENE_CACHE['sample_blocks'], block_size=SCENE_CACHE['block_size']):
+    """Hash evenly spaced blocks of a file (all of it when small) instead of reading a whole master"""
+    file_size = os.path.getsize(file_path)
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        if file_size <= sample_blocks * block_size:
+            digest.update(f.read())
+        else:
+            step = (file_size - block_size) / (sample_blocks - 1)
+            for block in range(sample_blocks):
+                f.seek(int(block * step))
+                digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+def get_scene_cache_key(video_path):
+    """Combine the file fingerprint with the detector and its parameters into a cache key"""
+    file_stat = os.stat(video_path)
+    settings = {name: value for name, value in SCENE_DETECTION.items() if name not in IGNORED_DETECTION_SETTINGS}
+    key = json.dumps({
+        'file_size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'sampled_hash': get_sampled_file_hash(video_path),
+        'detector': f"AdaptiveDetector/scenedetect-{scenedetect.__version__}",
+        'scene_detection': settings,
+        'video_conversion': VIDEO_CONVERSION
+    }, sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def get_scene_cache_path(cache_key, cache_folder=None):
+    return os.path.join(cache_folder or SCENE_CACHE['cache_folder'], f"{cache_key}.json")
+
+def load_cached_scenes(video_path, cache_folder=None):
+    """Get the cached scene list of a movie, or None; a hit counts as a use for eviction"""
+    cache_path = get_scene_cache_path(get_scene_cache_key(video_path), cache_folder)
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    os.utime(cache_path)
+    print_info(f"Using cached scene list for {os.path.basename(video_path)}: "
+               f"{Fore.YELLOW}{len(cached['scenes'])}{Fore.BLUE} scenes, detection skipped")
+    return cached['scenes']
+
+def save_cached_scenes(video_path, scenes_info, cache_folder=None):
+    """Cache a movie's complete scene list, then evict the least recently used lists over the size limit"""
+    cache_folder = cache_folder or SCENE_CACHE['cache_folder']
+    cache_path = get_scene_cache_path(get_scene_cache_key(video_path), cache_folder)
+    os.makedirs(cache_folder, exist_ok=True)
+    with open(cache_path + '.tmp', 'w') as f:
+        json.dump({'video': os.path.basename(video_path), 'scenes': scenes_info}, f, indent=OUTPUT['json_indent'])
+    os.replace(cache_path + '.tmp', cache_path)
+    print_success(f"Cached scene list in {Fore.YELLOW}{cache_path}")
+    evict_scene_cache(cache_folder, keep_path=cache_path)
+    return cache_path
+
+def evict_scene_cache(cache_folder=None, max_bytes=None, keep_path=None):
+    """Remove the least recently used scene lists until the cache fits in max_bytes"""
+    cache_folder = cache_folder or SCENE_CACHE['cache_folder']
+    max_bytes = SCENE_CACHE['max_bytes'] if max_bytes is None else max_bytes
+    entries = []
+    for file_name in os.listdir(cache_folder):
+        if file_name.endswith('.json'):
+            file_stat = os.stat(os.path.join(cache_folder, file_name))
+            entries.append((file_stat.st_mtime, file_stat.st_size, os.path.join(cache_folder, file_name)))
+    
+    total_bytes = sum(size for _mtime, size, _path in entries)
+    removed = 0
+    for _mtime, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        if path == keep_path:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another worker evicted it first
+            pass
+        total_bytes -= size
+        removed += 1
+    if removed:
+        print_info(f"Evicted {removed} least recently used scene lists from the scene cache")
+    return removed
\ No newline at end of file
@@ -1,42 +1,245 @@
-from scenedetect import open_video, SceneManager
+import argparse
+import sys
+import cv2
+from collections import deque
 from scenedetect.detectors import AdaptiveDetector
 from colorama import Fore
-from config import SCENE_DETECTION
-from utils import print_processing, print_success, print_warning
+from config import SCENE_CACHE, SCENE_DETECTION
+from detection_proxy import DetectionProxyWriter, load_detection_proxy, make_detection_proxy
+from profiling import stage_profiler
+from scene_cache import load_cached_scenes, save_cached_scenes
+from utils import print_info, print_processing, print_success, print_warning
 
-def find_and_split_scenes(video_path, frame_rate):
-    """Detect scenes in video using adaptive threshold"""
-    print_processing("Starting scene detection...")
-    
-    # Initialize scene detection
-    video = open_video(video_path)
-    scene_manager = SceneManager()
-    scene_manager.add_detector(AdaptiveDetector(
-        adaptive_threshold=SCENE_DETECTION['adaptive_threshold']
-    ))
-    
-    print(f"{Fore.BLUE}🔍 Analyzing video for scene changes...")
-    scene_manager.detect_scenes(video=video, show_progress=True)
-    
-    # Process detected scenes
-    scene_list = scene_manager.get_scene_list()
-    print_success(f"Found {Fore.YELLOW}{len(scene_list)}{Fore.GREEN} scenes")
-    
-    scenes_info = []
-    if scene_list:
-        for i, (start_time, end_time) in enumerate(scene_list):
-            start_frame = int(start_time.get_seconds() * frame_rate)
-            end_frame = int(end_time.get_seconds() * frame_rate)
-            scenes_info.append({
-                'scene_id': i + 1,
-                'start_time_seconds': round(start_time.get_seconds(), 2),
-                'end_time_seconds': round(end_time.get_seconds(), 2),
-                'start_frame': start_frame,
-                'end_frame': end_frame,
-                'frame_count': end_frame - start_frame + 1
-            })
-            print(f"{Fore.CYAN}  Scene {i+1}: Frames {start_frame}-{end_frame} ({end_frame-start_frame+1} frames)")
-    else:
-        print_warning("No scenes detected")
-    
-    return scenes_info
\ No newline at end of file
+class ProxyCutDetector:
+    """Adaptive cut detection on luma proxies, optionally sampling every n-th frame"""
+    
+    def __init__(self):
+        self.frame_step = max(SCENE_DETECTION['proxy_frame_step'], 1)
+        self._detector = AdaptiveDetector(
+            adaptive_threshold=SCENE_DETECTION['adaptive_threshold'],
+            window_width=SCENE_DETECTION['window_width'],
+            luma_only=True
+        )
+        # A cut is reported window_width samples late and placed within the step before it
+        self.delay_frames = (SCENE_DETECTION['window_width'] + 1) * self.frame_step - 1
+        self._recent = deque(maxlen=self.delay_frames + 2)
+        self._last_cut = 0
+    
+    def process(self, frame_idx, proxy):
+        """Feed the next frame's proxy and return the cuts confirmed so far"""
+        self._recent.append((frame_idx, proxy))
+        if frame_idx % self.frame_step:
+            return []
+        cuts = self._detector.process_frame(frame_idx, cv2.cvtColor(proxy, cv2.COLOR_GRAY2BGR))
+        return [self._place_cut(cut) for cut in cuts]
+    
+    def finish(self, frame_count):
+        """Return the cuts still held back at the end of the stream"""
+        return [self._place_cut(cut) for cut in self._detector.post_process(frame_count)]
+    
+    def _place_cut(self, cut):
+        """Move a cut found on a sampled frame back to the largest luma change since the previous sample"""
+        if self.frame_step > 1:
+            proxies = dict(self._recent)
+            luma_changes = {
+                frame_idx: cv2.absdiff(proxies[frame_idx], proxies[frame_idx - 1]).mean()
+                for frame_idx in range(max(cut - self.frame_step + 1, self._last_cut + 1), cut + 1)
+                if frame_idx in proxies and frame_idx - 1 in proxies
+            }
+            if luma_changes:
+                cut = max(luma_changes, key=luma_changes.get)
+        self._last_cut = cut
+        return cut
+
+class SceneSplitter:
+    """Detect scenes on already-decoded frames and hand out each scene as its cut is confirmed
+    
+    Detection runs on a small luma proxy of each frame. With video_path given and the proxy
+    cache enabled, the proxies of a full pass are cached for re-running detection later;
+    from_proxy means the frames already are cached proxies. Given known_cuts (from a cached
+    scene list), scenes are split at those cuts and nothing is detected.
+    """
+    
+    def __init__(self, frame_rate, completed_scenes=None, on_scene_finished=None, video_path=None, from_proxy=False, known_cuts=None):
+        self.frame_rate = frame_rate
+        self.scenes_info = list(completed_scenes or [])
+        self.frame_count = 0
+        self.on_scene_finished = on_scene_finished
+        self.video_path = video_path
+        self.from_proxy = from_proxy
+        self.known_cuts = known_cuts
+        self._cut_detector = ProxyCutDetector() if known_cuts is None else None
+        self._proxy_writer = None
+        self._frames = None
+        self._cuts = deque()
+        self._pending = deque()
+        self._previous = None
+        self._exhausted = False
+    
+    def iter_scenes(self, frames):
+        """Yield (scene, frames) pairs from a single pass over (frame_idx, frame_array) items
+        
+        The scene dict is completed (end frame, duration) once its frames have been consumed.
+        When resuming after completed scenes, frames must start one frame before the next
+        scene, matching the analysed range of that scene.
+        """
+        print_processing("Starting scene detection on decoded frames..." if self.known_cuts is None else "Splitting decoded frames at the cached cuts...")
+        self._frames = iter(frames)
+        start_frame = 0
+        
+        # The frame before a resumed scene is analysed with it but belongs to the finished scene,
+        # so detection restarts at the cut exactly as it did when that cut was found
+        if self.scenes_info:
+            start_frame = self.scenes_info[-1]['end_frame']
+            self._previous = next(self._frames, None)
+            self.frame_count = start_frame
+        if self.known_cuts is not None:
+            self._cuts.extend(cut for cut in self.known_cuts if cut > start_frame)
+        elif self.video_path is not None and SCENE_DETECTION['proxy_cache_folder'] and not self.from_proxy and not self.scenes_info:
+            # Only a pass over every frame makes a complete proxy
+            self._proxy_writer = DetectionProxyWriter(self.video_path, self.frame_rate)
+        
+        try:
+            while self._peek_settled_frame() is not None:
+                scene = self._new_scene(start_frame)
+                scene_frames = self._iter_scene_frames(scene)
+                yield scene, scene_frames
+                
+                # Detection still needs the frames the consumer did not read
+                for _ in scene_frames:
+                    pass
+                
+                self._finish_scene(scene)
+                start_frame = scene['end_frame']
+        finally:
+            if self._proxy_writer is not None:
+                if self._exhausted:
+                    self._proxy_writer.close()
+                else:
+                    self._proxy_writer.discard()
+                self._proxy_writer = None
+        
+        print_success(f"Found {Fore.YELLOW}{len(self.scenes_info)}{Fore.GREEN} scenes")
+        if not self.scenes_info:
+            print_warning("No scenes detected")
+    
+    def _new_scene(self, start_frame):
+        """Create a scene record whose end is filled in once its cut is confirmed"""
+        return {
+            'scene_id': len(self.scenes_info) + 1,
+            'start_time_seconds': round(start_frame / self.frame_rate, 2),
+            'end_time_seconds': None,
+            'start_frame': start_frame,
+            'end_frame': None,
+            'frame_count': None
+        }
+    
+    def _finish_scene(self, scene):
+        """Fill in the end of a scene and record it"""
+        start_frame = scene['start_frame']
+        end_frame = scene['end_frame']
+        scene['end_time_seconds'] = round(end_frame / self.frame_rate, 2)
+        scene['frame_count'] = end_frame - start_frame + 1
+        self.scenes_info.append(scene)
+        print(f"{Fore.CYAN}  Scene {scene['scene_id']}: Frames {start_frame}-{end_frame} ({end_frame-start_frame+1} frames)")
+        if self.on_scene_finished is not None:
+            self.on_scene_finished(scene)
+    
+    def _iter_scene_frames(self, scene):
+        """Yield the frames analysed for a scene, stopping at the next confirmed cut"""
+        # Analysed ranges start one frame before the cut (see video_reader.scene_frame_range)
+        if self._previous is not None and self._previous[0] >= scene['start_frame'] - 1:
+            yield self._previous
+        
+        while True:
+            item = self._peek_settled_frame()
+            if item is None:
+                scene['end_frame'] = self.frame_count
+                return
+            if self._cuts and item[0] >= self._cuts[0]:
+                scene['end_frame'] = self._cuts.popleft()
+                return
+            self._previous = self._pending.popleft()
+            yield item
+    
+    def _peek_settled_frame(self):
+        """Return the oldest frame for which every cut up to it has been reported"""
+        # A cut is reported some frames after it happens; known cuts need no look-ahead
+        delay_frames = self._cut_detector.delay_frames if self._cut_detector is not None else 0
+        while len(self._pending) <= delay_frames and not self._exhausted:
+            item = next(self._frames, None)
+            if item is None:
+                self._exhausted = True
+                if self._cut_detector is not None:
+                    self._cuts.extend(self._cut_detector.finish(self.frame_count))
+                break
+            frame_idx, frame_array = item
+            if self._cut_detector is not None:
+                with stage_profiler.stage('scene_detection', items=1):
+                    proxy = frame_array if self.from_proxy else make_detection_proxy(frame_array)
+                    if self._proxy_writer is not None:
+                        self._proxy_writer.write(proxy)
+                    self._cuts.extend(self._cut_detector.process(frame_idx, proxy))
+            self._pending.append(item)
+            self.frame_count = frame_idx + 1
+        
+        return self._pending[0] if self._pending else None
+
+def split_all_scenes(scene_splitter, frames):
+    """Run a scene splitter over every frame without analysing them"""
+    for _scene, scene_frames in scene_splitter.iter_scenes(frames):
+        for _ in scene_frames:
+            pass
+    return scene_splitter.scenes_info
+
+def detect_scenes_from_proxy(video_path, frame_rate=None):
+    """Detect scenes on a movie's cached luma proxy, or return None if none is cached"""
+    proxy, cached_frame_rate = load_detection_proxy(video_path)
+    if proxy is None:
+        return None
+    print_info(f"Detecting scenes on the cached luma proxy ({Fore.YELLOW}{len(proxy)}{Fore.BLUE} frames, no decoding)")
+    return split_all_scenes(SceneSplitter(frame_rate or cached_frame_rate, from_proxy=True), enumerate(proxy))
+
+def find_and_split_scenes(frame_source, frame_rate, video_path=None):
+    """Detect scenes in a decoded frame stream using adaptive threshold
+    
+    Given video_path, a scene list cached for the same file and settings is returned without
+    decoding; otherwise a cached luma proxy (if enabled) is used before decoding. The detected
+    scene list is cached for the next run.
+    """
+    if video_path is None:
+        return split_all_scenes(SceneSplitter(frame_rate), frame_source.iter_range(0))
+    
+    if SCENE_CACHE['enabled']:
+        scenes_info = load_cached_scenes(video_path)
+        if scenes_info is not None:
+            return scenes_info
+    
+    scenes_info = None
+    if SCENE_DETECTION['proxy_cache_folder']:
+        scenes_info = detect_scenes_from_proxy(video_path, frame_rate)
+    if scenes_info is None:
+        scenes_info = split_all_scenes(SceneSplitter(frame_rate, video_path=video_path), frame_source.iter_range(0))
+    if SCENE_CACHE['enabled']:
+        save_cached_scenes(video_path, scenes_info)
+    return scenes_info
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run scene detection on a movie's cached luma proxy, e.g. to tune the thresholds")
+    parser.add_argument('video_path')
+    parser.add_argument('--adaptive-threshold', type=float, default=SCENE_DETECTION['adaptive_threshold'])
+    parser.add_argument('--window-width', type=int, default=SCENE_DETECTION['window_width'])
+    parser.add_argument('--frame-step', type=int, default=SCENE_DETECTION['proxy_frame_step'])
+    parser.add_argument('--cache-folder', default=SCENE_DETECTION['proxy_cache_folder'] or 'detection_proxies')
+    args = parser.parse_args()
+    SCENE_DETECTION.update({
+        'adaptive_threshold': args.adaptive_threshold,
+        'window_width': args.window_width,
+        'proxy_frame_step': args.frame_step,
+        'proxy_cache_folder': args.cache_folder
+    })
+    
+    if detect_scenes_from_proxy(args.video_path) is None:
+        print_warning(f"No up-to-date detection proxy for {args.video_path} in {args.cache_folder}; "
+                      f"analyse it once with SCENE_DETECTION['proxy_cache_folder'] set")
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,190 @@
+import itertools
+import os
+import cv2
+import numpy as np
+from colorama import Fore
+from config import QUALITY_ANALYSIS, SCENE_DEDUP
+from profiling import stage_profiler
+from utils import print_info, print_success
+
+INDEX_SUFFIX = '_scene_index.npz'
+
+def compute_phash(frame_yuv):
+    """Get the 64-bit DCT perceptual hash of a yuv420p frame's luma plane"""
+    height = frame_yuv.shape[0] * 2 // 3
+    thumbnail = cv2.resize(frame_yuv[:height], (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(thumbnail)[:8, :8].flatten()
+    # As in the standard pHash, all 64 coefficients (DC included) are compared with their median
+    bits = low_frequencies > np.median(low_frequencies)
+    return np.frombuffer(np.packbits(bits).tobytes(), dtype='>u8')[0].astype(np.uint64)
+
+def count_bits(values):
+    """Count the set bits of each uint64 value"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(values.shape + (8,)), axis=-1).sum(axis=-1)
+
+def format_scene_hash(scene_hash):
+    return [f"{int(value):016x}" for value in scene_hash]
+
+def parse_scene_hash(hex_values):
+    return np.array([int(value, 16) for value in hex_values], dtype=np.uint64)
+
+def get_scene_index_path(movie_name, index_folder=None):
+    return os.path.join(index_folder or SCENE_DEDUP['index_folder'], f"{movie_name}{INDEX_SUFFIX}")
+
+class SceneIndex:
+    """Scene hashes of already analysed movies, searched by Hamming distance"""
+    
+    def __init__(self, hashes, movies, scene_ids, selection_offsets, selection_lengths):
+        self.hashes = hashes
+        self.movies = movies
+        self.scene_ids = scene_ids
+        self.selection_offsets = selection_offsets
+        self.selection_lengths = selection_lengths
+    
+    def __len__(self):
+        return len(self.hashes)
+    
+    def find_match(self, scene_hash):
+        """Get the nearest indexed scene whose every thumbnail is within the distance limit, or None"""
+        if not len(self.hashes):
+            return None
+        distances = count_bits(np.bitwise_xor(self.hashes, scene_hash))
+        matching = distances.max(axis=1) <= SCENE_DEDUP['max_hamming_distance']
+        if not matching.any():
+            return None
+        nearest = int(np.argmin(np.where(matching, distances.sum(axis=1), np.iinfo(np.int64).max)))
+        return {
+            'movie': self.movies[nearest],
+            'scene_id': int(self.scene_ids[nearest]),
+            'hamming_distance': int(distances[nearest].max()),
+            'selection_offset': int(self.selection_offsets[nearest]),
+            'selection_length': int(self.selection_lengths[nearest])
+        }
+
+def load_scene_index(index_folder=None, exclude_movie=None):
+    """Load the scene hashes of every indexed movie except exclude_movie into one SceneIndex"""
+    index_folder = index_folder or SCENE_DEDUP['index_folder']
+    parts = []
+    if os.path.isdir(index_folder):
+        for file_name in sorted(os.listdir(index_folder)):
+            movie_name = file_name[:-len(INDEX_SUFFIX)]
+            if not file_name.endswith(INDEX_SUFFIX) or movie_name == exclude_movie:
+                continue
+            with np.load(os.path.join(index_folder, file_name)) as data:
+                # Indexes built with another thumbnail count cannot be compared
+                if data['hashes'].shape[1] != SCENE_DEDUP['thumbnails']:
+                    continue
+                parts.append((movie_name, {name: data[name] for name in data.files}))
+    
+    if not parts:
+        return SceneIndex(np.zeros((0, SCENE_DEDUP['thumbnails']), dtype=np.uint64), [], *(np.zeros(0, dtype=np.int64),) * 3)
+    return SceneIndex(
+        np.concatenate([data['hashes'] for _movie, data in parts]),
+        [movie_name for movie_name, data in parts for _ in range(len(data['hashes']))],
+        np.concatenate([data['scene_ids'] for _movie, data in parts]),
+        np.concatenate([data['selection_offsets'] for _movie, data in parts]),
+        np.concatenate([data['selection_lengths'] for _movie, data in parts])
+    )
+
+def save_scene_index(movie_name, scenes_info, scene_results, index_folder=None):
+    """Index the hashed scenes of a movie that were analysed, not taken over from another movie"""
+    index_path = get_scene_index_path(movie_name, index_folder)
+    start_frames = {scene['scene_id']: scene['start_frame'] for scene in scenes_info}
+    indexed = [result for result in scene_results if result.get('scene_hash') and 'duplicate_of' not in result]
+    if not indexed:
+        return None
+    
+    # Selections are stored relative to the scene start, so they carry over to shifted versions
+    selection_offsets = [result['selected_frames'][0] - start_frames[result['scene_id']] if result['sequence_found'] else -1
+                         for result in indexed]
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    with open(index_path + '.tmp', 'wb') as f:
+        np.savez(f,
+                 hashes=np.stack([parse_scene_hash(result['scene_hash']) for result in indexed]),
+                 scene_ids=np.array([result['scene_id'] for result in indexed], dtype=np.int64),
+                 selection_offsets=np.array(selection_offsets, dtype=np.int64),
+                 selection_lengths=np.array([result['total_frames_selected'] for result in indexed], dtype=np.int64))
+    os.replace(index_path + '.tmp', index_path)
+    print_success(f"Indexed {len(indexed)} scene hashes in {Fore.YELLOW}{index_path}")
+    return index_path
+
+class SceneDeduplicator:
+    """Hash each scene from a few thumbnails and match it against the scenes of other analysed movies"""
+    
+    def __init__(self, movie_name, index_folder=None):
+        self.movie_name = movie_name
+        self.index = load_scene_index(index_folder, exclude_movie=movie_name)
+        if len(self.index):
+            print_info(f"Scene index: {Fore.YELLOW}{len(self.index)}{Fore.BLUE} scenes of "
+                       f"{len(set(self.index.movies))} other movies to match against")
+    
+    def hash_scene(self, scene, frames):
+        """Hash thumbnails spread over the start of a scene
+        
+        Returns the scene's frames (the ones read for hashing put back in front) and the
+        hashes, or None for a scene without frames.
+        """
+        thumbnails = SCENE_DEDUP['thumbnails']
+        step = max(SCENE_DEDUP['hash_window_frames'] // thumbnails, 1)
+        frames = iter(frames)
+        held_frames = []
+        hashes = []
+        for frame_idx, frame_array in frames:
+            held_frames.append((frame_idx, frame_array))
+            # Analysed ranges start one frame before the cut, which belongs to the previous scene
+            offset = frame_idx - scene['start_frame']
+            if offset >= 0 and offset % step == 0:
+                with stage_profiler.stage('scene_hashing', items=1):
+                    hashes.append(compute_phash(frame_array))
+            if len(hashes) == thumbnails or offset >= SCENE_DEDUP['hash_window_frames'] - 1:
+                break
+        
+        frames = itertools.chain(held_frames, frames)
+        if not hashes:
+            return frames, None
+        # Short scenes repeat their last thumbnail
+        hashes.extend(hashes[-1:] * (thumbnails - len(hashes)))
+        return frames, np.array(hashes, dtype=np.uint64)
+    
+    def match_scene(self, scene, frames, scene_hash, on_sequence_selected=None):
+        """Get the result of a scene that duplicates an indexed one, reading its frames without scoring them, or None
+        
+        A reused selection is passed to on_sequence_selected before the frames are read.
+        """
+        if scene_hash is None:
+            return None
+        match = self.index.find_match(scene_hash)
+        if match is None:
+            return None
+        
+        selected_frames = []
+        sequence_length = QUALITY_ANALYSIS['sequence_length']
+        if SCENE_DEDUP['on_match'] == 'reuse' and match['selection_offset'] >= 0 and match['selection_length'] == sequence_length:
+            selected_frames = list(range(scene['start_frame'] + match['selection_offset'],
+                                         scene['start_frame'] + match['selection_offset'] + sequence_length))
+            if selected_frames[0] >= 1 and on_sequence_selected is not None:
+                on_sequence_selected(selected_frames)
+        
+        # The scene's end is only known once its frames have been read
+        for _ in frames:
+            pass
+        if selected_frames and (selected_frames[0] < 1 or selected_frames[-1] > scene['end_frame']):
+            selected_frames = []
+        
+        stage_profiler.count('duplicate_scenes')
+        print_info(f"Scene {scene['scene_id']}: near-duplicate of {match['movie']} scene {match['scene_id']} "
+                   f"(distance {match['hamming_distance']}), {'selection reused' if selected_frames else 'skipped'}")
+        return {
+            'scene_id': scene['scene_id'],
+            'sequence_found': bool(selected_frames),
+            'selected_frames': selected_frames,
+            'total_frames_selected': len(selected_frames),
+            'scene_hash': format_scene_hash(scene_hash),
+            'duplicate_of': {
+                'movie': match['movie'],
+                'scene_id': match['scene_id'],
+                'hamming_distance': match['hamming_distance']
+            }
+        }
\ No newline at end of file
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from colorama import Fore
+from config import DEVICE, FRAME_CACHE, PIPELINE, PREFILTER, PROFILING, QUALITY_ANALYSIS, SCORE_STORE
+from batch_runner import limit_threads
+from frame_cache import FrameCacheWriter
+from frame_preprocessor import PrefilterCascade
+from quality_analyzer import initialize_quality_metrics, find_sequence_per_scene, find_sequences_per_scene_niqe_only
+from profiling import stage_profiler
+from score_store import ScoreStore
+from utils import disable_color, print_processing, print_success
+from video_reader import FrameSource, get_frame_pool_size, iter_720p_frames_from, load_frame_index, scene_frame_range
+
+# Quality metrics loaded once per scene worker process
+_scene_worker_metrics = None
+
+def init_scene_worker(num_threads, color_output=True):
+    """Set thread limits and colour output, and load the quality metrics once for this scene worker"""
+    global _scene_worker_metrics
+    if not color_output:
+        disable_color()
+    limit_threads(num_threads)
+    _scene_worker_metrics = initialize_quality_metrics(DEVICE, use_musiq=QUALITY_ANALYSIS['use_musiq'])
+
+def split_scene_chunks(scenes_info, num_chunks):
+    """Split scenes into contiguous chunks holding roughly the same number of frames"""
+    total_frames = sum(scene['frame_count'] for scene in scenes_info)
+    target_frames = max(total_frames / max(num_chunks, 1), 1)
+    chunks = [[]]
+    chunk_frames = 0
+    for scene in scenes_info:
+        if chunks[-1] and chunk_frames >= target_frames:
+            chunks.append([])
+            chunk_frames = 0
+        chunks[-1].append(scene)
+        chunk_frames += scene['frame_count']
+    return [chunk for chunk in chunks if chunk]
+
+def analyze_scene_chunk(mxf_file_path, scenes, base_video_name):
+    """Seek to a chunk's first scene with a private decoder and analyze its scenes in order"""
+    musiq_metric, niqe_metric, device = _scene_worker_metrics
+    stage_profiler.reset()
+    score_store = ScoreStore() if SCORE_STORE['enabled'] else None
+    prefilter = PrefilterCascade(PREFILTER)
+    
+    # Selected sequences go straight into the movie's frame cache; the parent indexes them
+    frame_cache = FrameCacheWriter(mxf_file_path, get_frame_pool_size() + QUALITY_ANALYSIS['batch_size']) if FRAME_CACHE['enabled'] else None
+    on_scene_result = frame_cache.cache_sequence if frame_cache is not None else None
+    hold_frames = frame_cache.hold_frames if frame_cache is not None else None
+    
+    first_idx = scene_frame_range(scenes[0])[0]
+    stop_idx = scene_frame_range(scenes[-1])[1]
+    frame_source = FrameSource(iter_720p_frames_from(mxf_file_path, first_idx, stop_idx, frame_cache), first_index=first_idx)
+    try:
+        scene_frames = frame_source.iter_scenes(scenes)
+        if QUALITY_ANALYSIS['use_musiq']:
+            scene_results = find_sequence_per_scene(scene_frames, base_video_name, musiq_metric, niqe_metric, device, score_store, on_scene_result, prefilter, hold_frames)
+        else:
+            scene_results = find_sequences_per_scene_niqe_only(scene_frames, base_video_name, niqe_metric, device, score_store, on_scene_result, prefilter, hold_frames)
+    finally:
+        frame_source.close()
+    
+    score_records = score_store.get_records() if score_store is not None else None
+    return scene_results, score_records, prefilter.get_stats(), stage_profiler.get_report()
+
+def analyze_scenes_in_parallel(mxf_file_path, scenes_info, base_video_name, score_store=None, prefilter=None, should_abort=None):
+    """Score detected scenes on a pool of workers and merge their results back in scene order
+    
+    should_abort is checked as each range finishes; when it returns True the ranges not yet
+    started are cancelled and the results so far are returned.
+    """
+    num_workers = PIPELINE['scene_workers'] or os.cpu_count()
+    threads_per_worker = max(1, os.cpu_count() // num_workers)
+    chunks = split_scene_chunks(scenes_info, num_workers * PIPELINE['scene_chunks_per_worker'])
+    print_processing(f"Analyzing {len(scenes_info)} scenes in {len(chunks)} ranges on {num_workers} workers...")
+    # Build the frame index the workers seek with once, instead of every worker racing to build it
+    load_frame_index(mxf_file_path)
+    
+    scene_results = []
+    # Spawned workers avoid sharing CUDA/OpenMP state with the parent
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=init_scene_worker, initargs=(threads_per_worker, PROFILING['color_output'])) as executor:
+        futures = [executor.submit(analyze_scene_chunk, mxf_file_path, chunk, base_video_name) for chunk in chunks]
+        for future in as_completed(futures):
+            chunk_results, score_records, prefilter_stats, stage_report = future.result()
+            stage_profiler.merge(stage_report)
+            scene_results.extend(chunk_results)
+            if score_store is not None and score_records is not None:
+                score_store.add_records(score_records)
+            if prefilter is not None:
+                prefilter.add_stats(prefilter_stats)
+            if should_abort is not None and should_abort():
+                for pending in futures:
+                    pending.cancel()
+                break
+    
+    scene_results.sort(key=lambda scene_result: scene_result['scene_id'])
+    sequences_found = sum(1 for scene_result in scene_results if scene_result['sequence_found'])
+    print_success(f"Scene workers found sequences in {Fore.YELLOW}{sequences_found}/{len(scene_results)}{Fore.GREEN} scenes")
+    return scene_results
\ No newline at end of file
@@ -0,0 +1,165 @@
+import json
+import os
+import numpy as np
+from colorama import Fore, Style
+from config import QUALITY_ANALYSIS, SCORE_STORE
+from data_exporter import save_analysis_json
+from utils import ensure_directory, print_processing, print_success, print_warning
+from video_reader import scene_frame_range
+
+SCORE_COLUMNS = ('niqe', 'musiq', 'std')
+
+class ScoreStore:
+    """Per-frame NIQE/MUSIQ/std scores of one movie, saved as a compact columnar .npz"""
+    
+    def __init__(self):
+        self._frame_numbers = []
+        self._columns = {column: [] for column in SCORE_COLUMNS}
+    
+    def add(self, frame_number, frame_std, scores=None):
+        """Record a frame; metrics that were not computed are stored as NaN"""
+        scores = scores or {}
+        self._frame_numbers.append(frame_number)
+        self._columns['std'].append(frame_std)
+        for column in ('niqe', 'musiq'):
+            value = scores.get(column)
+            self._columns[column].append(np.nan if value is None else value)
+    
+    def __len__(self):
+        return len(self._frame_numbers)
+    
+    def get_records(self, start=0):
+        """Get the records added since position start as JSON-friendly columns (NaN becomes None)"""
+        records = {'frame_number': [int(n) for n in self._frame_numbers[start:]]}
+        for column, values in self._columns.items():
+            records[column] = [None if np.isnan(value) else float(value) for value in values[start:]]
+        return records
+    
+    def add_records(self, records):
+        """Add columns previously returned by get_records"""
+        self._frame_numbers.extend(records['frame_number'])
+        for column in SCORE_COLUMNS:
+            self._columns[column].extend(np.nan if value is None else value for value in records[column])
+    
+    def save(self, output_path):
+        """Write scores sorted by frame number, keeping the last record of a repeated frame"""
+        frame_numbers = np.asarray(self._frame_numbers, dtype=np.int64)
+        
+        # Scene ranges overlap by one frame, so the same frame can be scored twice
+        reversed_unique, reversed_index = np.unique(frame_numbers[::-1], return_index=True)
+        index = len(frame_numbers) - 1 - reversed_index
+        
+        columns = {
+            column: np.asarray(values, dtype=np.float32)[index]
+            for column, values in self._columns.items()
+        }
+        ensure_directory(output_path)
+        np.savez(output_path, frame_number=reversed_unique.astype(np.int32), **columns)
+        print_success(f"Saved {len(index)} frame scores to: {Fore.YELLOW}{output_path}")
+        return output_path
+
+def get_scores_path(output_folder, base_video_name):
+    """Get the score store path that sits next to a movie's analysis JSON"""
+    return os.path.join(output_folder, f"{base_video_name}{SCORE_STORE['file_suffix']}")
+
+def load_scores(scores_path):
+    """Load a score store as a dict of equally long arrays keyed by column"""
+    with np.load(scores_path) as data:
+        return {key: data[key] for key in data.files}
+
+def select_sequences_from_scores(scores, scenes_info, use_musiq):
+    """Recompute scene_results from stored scores with the current QUALITY_ANALYSIS thresholds"""
+    sequence_length = QUALITY_ANALYSIS['sequence_length']
+    frame_numbers = scores['frame_number']
+    
+    # A frame is good only if it was scored and passes every active threshold
+    good = scores['std'] >= QUALITY_ANALYSIS['min_frame_variance']
+    good &= scores['niqe'] <= QUALITY_ANALYSIS['niqe_threshold']
+    if use_musiq:
+        good &= scores['musiq'] >= QUALITY_ANALYSIS['musiq_threshold']
+    
+    scene_results = []
+    unscored_scenes = []
+    for scene in scenes_info:
+        first_idx, stop_idx = scene_frame_range(scene)
+        scene_numbers = np.arange(first_idx + 1, stop_idx + 1)
+        
+        # Frames missing from the store break a run like a failed frame
+        if len(frame_numbers):
+            position = np.minimum(np.searchsorted(frame_numbers, scene_numbers), len(frame_numbers) - 1)
+            stored = frame_numbers[position] == scene_numbers
+            scene_good = stored & good[position]
+        else:
+            stored = scene_good = np.zeros(len(scene_numbers), dtype=bool)
+        
+        selected_frames = []
+        if len(scene_good) >= sequence_length:
+            window_sums = np.convolve(scene_good.astype(np.int32), np.ones(sequence_length, dtype=np.int32), 'valid')
+            hits = np.flatnonzero(window_sums == sequence_length)
+            if len(hits):
+                selected_frames = scene_numbers[hits[0]:hits[0] + sequence_length].tolist()
+        
+        if not selected_frames and not stored.all():
+            unscored_scenes.append(scene['scene_id'])
+        
+        scene_results.append({
+            'scene_id': scene['scene_id'],
+            'sequence_found': bool(selected_frames),
+            'selected_frames': selected_frames,
+            'total_frames_selected': len(selected_frames)
+        })
+    
+    return scene_results, unscored_scenes
+
+def reselect_from_scores(json_path, scores_path):
+    """Rewrite an analysis JSON from its stored scores without decoding or re-scoring"""
+    with open(json_path, 'r') as f:
+        analysis_data = json.load(f)
+    
+    use_musiq = QUALITY_ANALYSIS['use_musiq']
+    scores = load_scores(scores_path)
+    if use_musiq and np.isnan(scores['musiq']).all():
+        print_warning(f"No MUSIQ scores stored in {os.path.basename(scores_path)}; re-score with use_musiq enabled")
+        return None
+    
+    scenes_info = analysis_data['scene_detection']['scenes']
+    scene_results, unscored_scenes = select_sequences_from_scores(scores, scenes_info, use_musiq)
+    
+    # Keep what the pipeline recorded besides the selection; scenes taken over from another
+    # movie were never scored, so they keep their result as it is
+    previous_results = {result['scene_id']: result for result in analysis_data['quality_analysis']['scene_results']}
+    for position, scene_result in enumerate(scene_results):
+        previous_result = previous_results.get(scene_result['scene_id'], {})
+        if 'duplicate_of' in previous_result:
+            scene_results[position] = previous_result
+            continue
+        for key, value in previous_result.items():
+            scene_result.setdefault(key, value)
+    unscored_scenes = [scene_id for scene_id in unscored_scenes if 'duplicate_of' not in previous_results.get(scene_id, {})]
+    if unscored_scenes:
+        print_warning(f"{len(unscored_scenes)} scenes without a sequence were not fully scored; "
+                      f"enable SCORE_STORE['score_full_scenes'] and re-analyze to search them completely")
+    
+    return save_analysis_json(analysis_data['video_information'], scenes_info, scene_results, json_path,
+                              analysis_data['quality_analysis'].get('prefilter'))
+
+def reselect_all_analysis_files(analysis_results_folder="analysis_results"):
+    """Re-run sequence selection for every analysis JSON that has a score store"""
+    print_processing(f"Re-selecting sequences from stored scores in '{analysis_results_folder}'")
+    
+    json_files = sorted(f for f in os.listdir(analysis_results_folder) if f.endswith('_analysis.json'))
+    for json_file in json_files:
+        base_video_name = json_file[:-len('_analysis.json')]
+        scores_path = get_scores_path(analysis_results_folder, base_video_name)
+        if not os.path.exists(scores_path):
+            print(f"{Fore.YELLOW}⏩ Skipping '{json_file}': No stored scores{Style.RESET_ALL}")
+            continue
+        
+        analysis_data = reselect_from_scores(os.path.join(analysis_results_folder, json_file), scores_path)
+        if analysis_data:
+            quality = analysis_data['quality_analysis']
+            print(f"{Fore.CYAN}   {base_video_name}: {quality['total_scenes_with_sequences']}/"
+                  f"{analysis_data['scene_detection']['total_scenes_detected']} scenes with sequences")
+
+if __name__ == "__main__":
+    reselect_all_analysis_files("analysis_results")
@@ -0,0 +1,92 @@
+import json
+import queue
+import threading
+from config import PIPELINE
+from utils import ensure_directory
+
+_END = object()
+
+class ThreadedFrameReader:
+    """Decode frames on a background thread, handing them over through a bounded queue"""
+    
+    def __init__(self, frames, max_frames=PIPELINE['decode_queue_frames']):
+        self._frames = frames
+        self._queue = queue.Queue(maxsize=max(max_frames, 1))
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="frame-decoder", daemon=True)
+        self._thread.start()
+    
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+    
+    def _run(self):
+        """Decode ahead of the consumer until the queue is full (PyAV releases the GIL while decoding)"""
+        try:
+            for item in self._frames:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._error = e
+        self._put(_END)
+    
+    def _put(self, item):
+        """Block while the queue is full, giving up if the reader is closed"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def close(self):
+        """Stop decoding and wait for the decode thread to exit"""
+        self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+class SceneResultWriter:
+    """Write each scene result as a JSON line on a background thread as soon as its scene is finished"""
+    
+    def __init__(self, output_path, max_results=PIPELINE['result_queue_size'], mode='w'):
+        self.output_path = output_path
+        self._queue = queue.Queue(maxsize=max(max_results, 1))
+        self._error = None
+        ensure_directory(output_path)
+        self._file = open(output_path, mode)
+        self._thread = threading.Thread(target=self._run, name="scene-result-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, scene_result):
+        """Queue a finished scene result; blocks while the writer is behind"""
+        self._queue.put(dict(scene_result))
+    
+    def _run(self):
+        while True:
+            scene_result = self._queue.get()
+            if scene_result is _END:
+                return
+            try:
+                self._file.write(json.dumps(scene_result) + '\n')
+                self._file.flush()
+            except Exception as e:
+                self._error = e
+    
+    def close(self):
+        """Write the remaining results and close the output file"""
+        self._queue.put(_END)
+        self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
\ No newline at end of file
@@ -1,10 +1,18 @@
 import os
 import torch
-from colorama import Fore, Style, init
+import colorama
+from colorama import Back, Fore, Style, init
 
 # Initialize colorama for colored output
 init(autoreset=True)
 
+def disable_color():
+    """Print plain text: blank the shared colour codes and stop wrapping stdout"""
+    colorama.deinit()
+    for codes in (Fore, Back, Style):
+        for name in list(vars(codes)):
+            setattr(codes, name, '')
+
 def get_device(device_preference='auto'):
     """Get the appropriate device for PyTorch operations"""
     if device_preference == 'auto':
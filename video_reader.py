@@ -1,10 +1,14 @@
 import av
-import cv2
 import os
+import numpy as np
+from collections import deque
+from fractions import Fraction
+from av.video.reformatter import VideoReformatter
 from tqdm import tqdm
 from colorama import Fore, Style
-from config import VIDEO_CONVERSION
-from utils import print_processing, print_success
+from config import FRAME_EXTRACTION, PIPELINE, QUALITY_ANALYSIS, SCENE_DEDUP, SCENE_DETECTION, STREAMING, VIDEO_CONVERSION
+from profiling import stage_profiler
+from utils import print_processing, print_success, print_warning
 
 def print_video_info(file_path, container, video_stream, frame_rate, total_frames):
     """Display video file information and metadata"""
@@ -22,28 +26,333 @@ def print_video_info(file_path, container, video_stream, frame_rate, total_frame
     print(f"{Fore.WHITE}Total Frames: {Fore.GREEN}{total_frames}")
     print(f"{Fore.CYAN}{'='*60}{Style.RESET_ALL}")
 
-def convert_frame_to_720p(frame):
-    """Convert frame to 720p resolution at 8-bit depth"""
-    frame_720p = frame.reformat(
-        width=VIDEO_CONVERSION['target_width'], 
-        height=VIDEO_CONVERSION['target_height'], 
-        format=VIDEO_CONVERSION['format']
-    )
-    return frame_720p.to_ndarray()
-
-def read_mxf_video(file_path):
-    """Read MXF video file and convert frames to 720p"""
+def configure_decoder_threads(video_stream):
+    """Enable frame/slice threading on a stream's decoder; must run before the first frame is decoded"""
+    video_stream.codec_context.thread_type = STREAMING['decode_thread_type']
+    video_stream.codec_context.thread_count = STREAMING['decode_threads']
+
+def get_frame_index_path(video_path):
+    """Get the path of the persisted frame index for a video"""
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(FRAME_EXTRACTION['index_folder'], f"{video_name}_frame_index.npz")
+
+def build_frame_index(video_path):
+    """Map frame numbers to PTS and keyframe flags by demuxing packets, without decoding"""
+    container = av.open(video_path)
+    video_stream = container.streams.video[0]
+    
+    pts_values = []
+    keyframes = []
+    for packet in tqdm(container.demux(video_stream), desc="Indexing packets", unit="packet"):
+        pts = packet.pts if packet.pts is not None else packet.dts
+        if pts is None:
+            continue
+        pts_values.append(pts)
+        keyframes.append(packet.is_keyframe)
+    container.close()
+    
+    # Frames are numbered in presentation order, which differs from packet order with B-frames
+    pts_values = np.asarray(pts_values, dtype=np.int64)
+    order = np.argsort(pts_values, kind='stable')
+    return {'pts': pts_values[order], 'keyframe': np.asarray(keyframes, dtype=bool)[order]}
+
+def load_frame_index(video_path):
+    """Load the persisted frame index of a video, building it if missing or stale"""
+    index_path = get_frame_index_path(video_path)
+    file_stat = os.stat(video_path)
+    
+    if os.path.exists(index_path):
+        with np.load(index_path) as data:
+            if data['file_size'] == file_stat.st_size and data['mtime'] == file_stat.st_mtime:
+                return {'pts': data['pts'], 'keyframe': data['keyframe']}
+    
+    print(f"{Fore.CYAN}🗂️ Building frame index for {os.path.basename(video_path)}")
+    frame_index = build_frame_index(video_path)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    # Written aside and renamed, so a reader in another process never loads a half-written index
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.savez(f, file_size=file_stat.st_size, mtime=file_stat.st_mtime, **frame_index)
+    os.replace(temp_path, index_path)
+    return frame_index
+
+def group_frame_runs(frame_numbers):
+    """Group sorted frame numbers into runs of consecutive frames"""
+    runs = []
+    for frame_number in sorted(frame_numbers):
+        if runs and frame_number == runs[-1][-1] + 1:
+            runs[-1].append(frame_number)
+        else:
+            runs.append([frame_number])
+    return runs
+
+def iter_frames_by_seeking(video_path, frame_numbers):
+    """Yield (frame_number, frame) for the given frame numbers, seeking to the keyframe before each run"""
+    frame_index = load_frame_index(video_path)
+    pts_values = frame_index['pts']
+    keyframe_positions = np.flatnonzero(frame_index['keyframe'])
+    
+    container = av.open(video_path)
+    video_stream = container.streams.video[0]
+    configure_decoder_threads(video_stream)
+    
+    try:
+        for run in group_frame_runs(frame_numbers):
+            first_position = run[0] - 1
+            if first_position >= len(pts_values):
+                continue
+            
+            # Start decoding from the nearest keyframe at or before the run
+            keyframe_slot = np.searchsorted(keyframe_positions, first_position, side='right') - 1
+            seek_position = keyframe_positions[keyframe_slot] if keyframe_slot >= 0 else 0
+            container.seek(int(pts_values[seek_position]), stream=video_stream, backward=True, any_frame=False)
+            
+            position = seek_position
+            wanted = set(run)
+            for frame in container.decode(video_stream):
+                # Frame numbers follow PTS order; fall back to counting when a frame has no PTS
+                if frame.pts is not None:
+                    position = int(np.searchsorted(pts_values, frame.pts))
+                frame_number = position + 1
+                position += 1
+                
+                if frame_number > run[-1]:
+                    break
+                if frame_number in wanted:
+                    wanted.discard(frame_number)
+                    yield frame_number, frame
+    finally:
+        container.close()
+
+def get_frame_pool_size():
+    """Get the ring size needed so a pooled frame is never overwritten while still held downstream
+    
+    Frames are held by the look-back buffer, the threaded reader's queue, the scene detector's
+    look-ahead, the coarse-to-fine search window and the frames held for scene hashing, plus a
+    few in flight between them.
+    """
+    held_frames = (STREAMING['buffer_frames'] + PIPELINE['decode_queue_frames']
+                   + (SCENE_DETECTION['window_width'] + 1) * max(SCENE_DETECTION['proxy_frame_step'], 1)
+                   + QUALITY_ANALYSIS['sequence_length'])
+    if SCENE_DEDUP['enabled']:
+        held_frames += SCENE_DEDUP['hash_window_frames']
+    return held_frames + 4
+
+def make_frame_pool(max_frames=None):
+    """Create the frame ring for one decoder (no larger than the max_frames it will decode), or None when pooling is disabled"""
+    pool_frames = STREAMING['frame_pool_frames']
+    if pool_frames == 0 or VIDEO_CONVERSION['format'] != 'yuv420p':
+        return None
+    required_frames = get_frame_pool_size()
+    if pool_frames is not None and pool_frames < required_frames:
+        print_warning(f"frame_pool_frames={pool_frames} is below the {required_frames} frames the pipeline can hold; using {required_frames}")
+    pool_frames = max(pool_frames or 0, required_frames)
+    if max_frames is not None:
+        pool_frames = min(pool_frames, max(max_frames, 1))
+    return FramePool(pool_frames)
+
+class FramePool:
+    """A fixed ring of preallocated frame buffers handed out in turn and overwritten in place"""
+    
+    def __init__(self, pool_frames):
+        self.pool_frames = pool_frames
+        self._buffers = None
+        self._next_slot = 0
+    
+    def next_buffer(self, shape):
+        """Get the next buffer of the ring; the one handed out pool_frames calls ago is reused"""
+        if self._buffers is None or self._buffers.shape[1:] != shape:
+            self._buffers = np.empty((self.pool_frames,) + shape, dtype=np.uint8)
+            self._next_slot = 0
+            stage_profiler.count('buffer_allocations', self.pool_frames)
+        buffer = self._buffers[self._next_slot]
+        self._next_slot = (self._next_slot + 1) % self.pool_frames
+        return buffer
+
+def copy_yuv420_frame(frame, out):
+    """Copy a yuv420p VideoFrame's planes into an (H*3/2, W) array laid out like frame.to_ndarray()"""
+    flat = out.reshape(-1)
+    offset = 0
+    plane_sizes = ((frame.height, frame.width), (frame.height // 2, frame.width // 2), (frame.height // 2, frame.width // 2))
+    for plane, (plane_height, plane_width) in zip(frame.planes, plane_sizes):
+        # Plane rows are padded to line_size bytes
+        rows = np.frombuffer(plane, dtype=np.uint8, count=plane.line_size * plane_height).reshape(plane_height, plane.line_size)
+        np.copyto(flat[offset:offset + plane_height * plane_width].reshape(plane_height, plane_width), rows[:, :plane_width])
+        offset += plane_height * plane_width
+    return out
+
+class Frame720pScaler:
+    """Convert decoded frames to the analysis size and format through one reused filter graph or swscale context
+    
+    With a FramePool the converted pixels are copied into its ring instead of a new array per frame.
+    """
+    
+    def __init__(self, method=STREAMING['scaler'], pool=None):
+        self.method = method
+        self.pool = pool
+        self._reformatter = VideoReformatter()
+        self._graph = None
+        self._graph_input = None
+    
+    def convert(self, frame):
+        """Return a frame as a yuv420p ndarray at the target resolution; 'reformat' gives the same pixels as VideoFrame.reformat"""
+        if self.method == 'filter_graph':
+            frame_720p = self._filter(frame)
+        else:
+            frame_720p = self._reformatter.reformat(
+                frame,
+                width=VIDEO_CONVERSION['target_width'],
+                height=VIDEO_CONVERSION['target_height'],
+                format=VIDEO_CONVERSION['format']
+            )
+        if self.pool is None:
+            stage_profiler.count('buffer_allocations')
+            return frame_720p.to_ndarray()
+        return copy_yuv420_frame(frame_720p, self.pool.next_buffer((frame_720p.height * 3 // 2, frame_720p.width)))
+    
+    def _filter(self, frame):
+        # A graph is built for the first frame and rebuilt only if the input size or format changes
+        frame_input = (frame.width, frame.height, frame.format.name)
+        if frame_input != self._graph_input:
+            self._graph = self._build_graph(frame)
+            self._graph_input = frame_input
+        self._graph.vpush(frame)
+        return self._graph.vpull()
+    
+    def _build_graph(self, frame):
+        """buffer -> scale -> format -> buffersink
+        
+        Bilinear scaling and out_range=tv (full-range yuvj input is converted to limited range)
+        match frame.reformat, so scores do not depend on the scaler.
+        """
+        graph = av.filter.Graph()
+        source = graph.add_buffer(width=frame.width, height=frame.height, format=frame.format,
+                                  time_base=frame.time_base or Fraction(1, 1000))
+        scale = graph.add('scale', f"w={VIDEO_CONVERSION['target_width']}:h={VIDEO_CONVERSION['target_height']}:flags=bilinear:out_range=tv")
+        pixel_format = graph.add('format', f"pix_fmts={VIDEO_CONVERSION['format']}")
+        sink = graph.add('buffersink')
+        source.link_to(scale)
+        scale.link_to(pixel_format)
+        pixel_format.link_to(sink)
+        graph.configure()
+        return graph
+
+class FrameSource:
+    """Lazily decoded frames, consumed forward-only with a bounded look-back buffer"""
+    
+    def __init__(self, frames, container=None, buffer_frames=STREAMING['buffer_frames'], first_index=0):
+        self._frames = iter(frames)
+        self._container = container
+        self._buffer = deque(maxlen=max(buffer_frames, 1))
+        self._next_index = first_index
+    
+    def iter_range(self, start_idx, end_idx=None):
+        """Yield (frame_idx, frame_array) for start_idx <= frame_idx < end_idx (or to the end)"""
+        if end_idx is None:
+            end_idx = float('inf')
+        if start_idx < self._next_index:
+            if not self._buffer or self._buffer[0][0] > start_idx:
+                raise ValueError(f"Frame {start_idx} was already released from the stream buffer")
+            for frame_idx, frame_array in list(self._buffer):
+                if start_idx <= frame_idx < end_idx:
+                    yield frame_idx, frame_array
+        
+        # Decode forward, dropping frames that precede the requested range
+        while self._next_index < end_idx:
+            frame_array = next(self._frames, None)
+            if frame_array is None:
+                return
+            frame_idx = self._next_index
+            self._next_index += 1
+            self._buffer.append((frame_idx, frame_array))
+            if frame_idx >= start_idx:
+                yield frame_idx, frame_array
+    
+    def iter_scenes(self, scenes_info):
+        """Yield (scene, frames) pairs, releasing each scene's frames once the next one starts"""
+        for scene in scenes_info:
+            first_idx, stop_idx = scene_frame_range(scene)
+            yield scene, self.iter_range(first_idx, stop_idx)
+    
+    def close(self):
+        """Stop decoding, release buffered frames and close the container"""
+        self._buffer.clear()
+        if hasattr(self._frames, 'close'):
+            self._frames.close()
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+def scene_frame_range(scene):
+    """Get the 0-based [first, stop) frame index range analysed for a scene"""
+    return max(scene['start_frame'] - 1, 0), scene['end_frame']
+
+def iter_720p_frames(container, video_stream, total_frames, frame_cache=None):
+    """Decode frames one at a time and yield them converted to 720p (handing the decoded frames to frame_cache)"""
+    frame_count = 0
+    scaler = Frame720pScaler(pool=make_frame_pool())
+    decoded_frames = container.decode(video_stream)
+    with tqdm(total=total_frames, desc="Decoding frames", unit="frame", colour="blue") as pbar:
+        while True:
+            with stage_profiler.stage('decode', items=1):
+                frame = next(decoded_frames, None)
+            if frame is None:
+                break
+            frame_count += 1
+            with stage_profiler.stage('reformat_720p', items=1):
+                frame_array = scaler.convert(frame)
+            if frame_cache is not None:
+                frame_cache.add_frame(frame_count - 1, frame)
+            yield frame_array
+            pbar.update(1)
+    print_success(f"Successfully decoded {frame_count} frames at 720p")
+
+def iter_720p_frames_from(file_path, start_idx, stop_idx=None, frame_cache=None):
+    """Seek to frame start_idx using the persisted frame index and yield frames up to stop_idx converted to 720p"""
+    frame_count = len(load_frame_index(file_path)['pts'])
+    frame_numbers = range(start_idx + 1, min(stop_idx or frame_count, frame_count) + 1)
+    scaler = Frame720pScaler(pool=make_frame_pool(len(frame_numbers)))
+    with tqdm(total=len(frame_numbers), desc="Decoding frames", unit="frame", colour="blue") as pbar:
+        for frame_number, frame in iter_frames_by_seeking(file_path, frame_numbers):
+            with stage_profiler.stage('reformat_720p', items=1):
+                frame_array = scaler.convert(frame)
+            if frame_cache is not None:
+                frame_cache.add_frame(frame_number - 1, frame)
+            yield frame_array
+            pbar.update(1)
+    print_success(f"Successfully decoded {len(frame_numbers)} frames at 720p from frame {start_idx}")
+
+def get_stream_timing(container, video_stream):
+    """Get frame rate and frame count from the container without decoding"""
+    rate = video_stream.average_rate or video_stream.guessed_rate
+    frame_rate = float(rate) if rate else 0.0
+    total_frames = video_stream.frames
+    
+    # Some containers do not store a frame count; estimate it from the duration
+    if not total_frames:
+        if video_stream.duration is not None:
+            duration = float(video_stream.duration * video_stream.time_base)
+        else:
+            duration = (container.duration or 0) / av.time_base
+        total_frames = int(round(duration * frame_rate))
+    
+    return frame_rate, total_frames
+
+def read_mxf_video(file_path, start_idx=0, frame_cache=None):
+    """Open MXF video file and return a lazy 720p frame source with its metadata
+    
+    A non-zero start_idx seeks straight to that frame, e.g. to resume an interrupted run.
+    A FrameCacheWriter given as frame_cache is handed every decoded full-resolution frame.
+    """
     print_processing("Opening MXF video file...")
     
     # Open video containers
     container = av.open(file_path)
     video_stream = container.streams.video[0]
+    configure_decoder_threads(video_stream)
     
-    # Get accurate frame info using OpenCV
-    cap = cv2.VideoCapture(file_path)
-    frame_rate = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    cap.release()
+    # Get frame info from the same container that will be decoded
+    frame_rate, total_frames = get_stream_timing(container, video_stream)
     
     print_video_info(file_path, container, video_stream, frame_rate, total_frames)
     
@@ -59,18 +368,11 @@ def read_mxf_video(file_path):
         'total_frames': total_frames
     }
     
-    print(f"{Fore.BLUE}🔄 Converting frames to 720p...")
-    frame_count = 0
-    frames_720p = []
-    
-    # Process each frame with progress tracking
-    with tqdm(total=total_frames, desc="Processing frames", unit="frame", colour="blue") as pbar:
-        for frame in container.decode(video_stream):
-            frame_count += 1
-            converted_frame = convert_frame_to_720p(frame)
-            frames_720p.append(converted_frame)
-            pbar.update(1)
-    
-    container.close()
-    print_success(f"Successfully processed {frame_count} frames and converted to 720p")
-    return frames_720p, video_info
\ No newline at end of file
+    # Frames are decoded and converted on demand as scenes are analysed
+    print(f"{Fore.BLUE}🔄 Streaming frames at 720p (buffer: {STREAMING['buffer_frames']} frames)...")
+    if start_idx:
+        frames = iter_720p_frames_from(file_path, start_idx, frame_cache=frame_cache)
+    else:
+        frames = iter_720p_frames(container, video_stream, total_frames, frame_cache)
+    frame_source = FrameSource(frames, container, first_index=start_idx)
+    return frame_source, video_info
\ No newline at end of file
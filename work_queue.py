@@ -0,0 +1,207 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from colorama import Fore, Style
+from config import BATCH_PROCESSING, PROFILING, WORK_QUEUE
+from batch_runner import append_status, get_movies_to_process, init_worker, process_movie
+from utils import disable_color, print_header, print_info, print_success, print_warning
+
+def get_worker_id():
+    """Identify this worker across nodes sharing the output folder"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def get_lease_path(output_folder, movie_name):
+    """Get the lease file that marks a movie as claimed"""
+    return os.path.join(output_folder, WORK_QUEUE['lease_folder'], f"{movie_name}.lease")
+
+def read_lease(lease_path):
+    """Read a lease's owner record, or None if it is gone or still being written"""
+    try:
+        with open(lease_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def is_lease_stale(lease_path, timeout_seconds):
+    """Check whether a lease's heartbeat (its mtime) is older than the timeout"""
+    try:
+        return time.time() - os.stat(lease_path).st_mtime > timeout_seconds
+    except FileNotFoundError:
+        return False
+
+class Lease:
+    """An exclusively created lease file kept alive by a heartbeat thread"""
+    
+    def __init__(self, lease_path, worker_id):
+        self.lease_path = lease_path
+        self.worker_id = worker_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+    
+    @classmethod
+    def try_acquire(cls, lease_path, worker_id, timeout_seconds=None):
+        """Claim a lease, reclaiming it first if its owner stopped sending heartbeats; None if held"""
+        timeout_seconds = timeout_seconds or WORK_QUEUE['lease_timeout_seconds']
+        os.makedirs(os.path.dirname(lease_path), exist_ok=True)
+        if is_lease_stale(lease_path, timeout_seconds):
+            # Renaming is atomic, so only one worker moves a stale lease out of the way
+            stale_path = f"{lease_path}.stale.{worker_id.replace(':', '_')}"
+            try:
+                os.rename(lease_path, stale_path)
+            except FileNotFoundError:
+                stale_path = None
+            if stale_path is not None:
+                # Another worker may have reclaimed it first; put its fresh lease back
+                if not is_lease_stale(stale_path, timeout_seconds):
+                    try:
+                        os.link(stale_path, lease_path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale_path)
+                    return None
+                owner = read_lease(stale_path)
+                os.remove(stale_path)
+                print_warning(f"Reclaimed stale lease {os.path.basename(lease_path)} "
+                              f"from {owner['worker_id'] if owner else 'unknown worker'}")
+        
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'worker_id': worker_id, 'acquired_at': time.time()}, f)
+        
+        lease = cls(lease_path, worker_id)
+        lease._thread.start()
+        return lease
+    
+    def _heartbeat(self):
+        """Refresh the lease's mtime until released; notice if another worker took it over"""
+        while not self._stop.wait(WORK_QUEUE['heartbeat_seconds']):
+            owner = read_lease(self.lease_path)
+            if owner is None:
+                # Briefly missing while another worker checks whether it is stale
+                continue
+            if owner['worker_id'] != self.worker_id:
+                self.lost = True
+                print_warning(f"Lost lease {os.path.basename(self.lease_path)}")
+                return
+            os.utime(self.lease_path)
+    
+    def is_lost(self):
+        """Check whether another worker owns the lease now, without waiting for the next heartbeat"""
+        if not self.lost:
+            owner = read_lease(self.lease_path)
+            if owner is not None and owner['worker_id'] != self.worker_id:
+                self.lost = True
+                print_warning(f"Lost lease {os.path.basename(self.lease_path)}; abandoning the movie")
+        return self.lost
+    
+    def release(self):
+        """Stop the heartbeat and remove the lease if it is still ours"""
+        self._stop.set()
+        self._thread.join()
+        owner = read_lease(self.lease_path)
+        if owner is not None and owner['worker_id'] == self.worker_id:
+            os.remove(self.lease_path)
+
+def run_worker(mxf_folder="movie", output_folder="analysis_results", worker_id=None, threads=None):
+    """Claim and analyze movies until none are left, coordinating with other workers through lease files
+    
+    Any number of workers, on one node or several sharing the folders, can run this at once.
+    A movie whose worker crashed is picked up after its lease expires and resumes from its
+    checkpoint journal.
+    """
+    worker_id = worker_id or get_worker_id()
+    status_path = os.path.join(output_folder, BATCH_PROCESSING['status_file'])
+    print_header(f"🤝 WORK QUEUE WORKER {worker_id}")
+    init_worker(threads or BATCH_PROCESSING['threads_per_worker'] or os.cpu_count(), PROFILING['color_output'])
+    
+    statuses = []
+    attempted = set()
+    while True:
+        # A movie that failed here is left to other workers instead of being retried forever
+        movies_to_process = [path for path in get_movies_to_process(mxf_folder, output_folder) if path not in attempted]
+        if not movies_to_process:
+            break
+        
+        claimed_any = False
+        for mxf_file_path in movies_to_process:
+            movie_name = os.path.splitext(os.path.basename(mxf_file_path))[0]
+            lease = Lease.try_acquire(get_lease_path(output_folder, movie_name), worker_id)
+            if lease is None:
+                continue
+            claimed_any = True
+            
+            try:
+                # Another worker may have finished it between listing and claiming
+                if os.path.exists(os.path.join(output_folder, f"{movie_name}_analysis.json")):
+                    continue
+                print_info(f"{worker_id} claimed {Fore.YELLOW}{movie_name}")
+                attempted.add(mxf_file_path)
+                # A worker that lost its lease stops between scenes and leaves the results to the new owner
+                status = process_movie(mxf_file_path, output_folder, should_abort=lease.is_lost)
+                status['worker_pid'] = worker_id
+                append_status(status_path, status)
+                statuses.append(status)
+            finally:
+                lease.release()
+        
+        # Everything left is leased by other workers; wait for them to finish or go stale
+        if not claimed_any:
+            time.sleep(WORK_QUEUE['poll_seconds'])
+    
+    completed = sum(1 for status in statuses if status['status'] == 'completed')
+    print_success(f"{worker_id} finished: {completed} completed, {len(statuses) - completed} failed or aborted")
+    print(f"{Fore.CYAN}📋 Status report: {Fore.YELLOW}{status_path}{Style.RESET_ALL}")
+    return statuses
+
+def run_local_worker(mxf_folder, output_folder, threads, queue_settings, color_output):
+    """Entry point of a worker started by run_local_workers (spawned processes re-import the config)"""
+    WORK_QUEUE.update(queue_settings)
+    if not color_output:
+        PROFILING['color_output'] = False
+        disable_color()
+    run_worker(mxf_folder, output_folder, threads=threads)
+
+def run_local_workers(mxf_folder, output_folder, num_workers):
+    """Run several workers on this machine against the same folders, e.g. to try out lease handling"""
+    threads = max(1, os.cpu_count() // num_workers)
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_local_worker, args=(mxf_folder, output_folder, threads, dict(WORK_QUEUE), PROFILING['color_output']))
+                 for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run work queue workers against shared movie and output folders")
+    parser.add_argument('--movie-folder', default="movie")
+    parser.add_argument('--output-folder', default="analysis_results")
+    parser.add_argument('--workers', type=int, default=1, help="workers to start on this machine")
+    parser.add_argument('--lease-timeout', type=float, default=WORK_QUEUE['lease_timeout_seconds'])
+    parser.add_argument('--heartbeat', type=float, default=WORK_QUEUE['heartbeat_seconds'])
+    parser.add_argument('--poll', type=float, default=WORK_QUEUE['poll_seconds'])
+    parser.add_argument('--no-color', action='store_true', help="print without ANSI colours")
+    args = parser.parse_args()
+    if args.no_color:
+        PROFILING['color_output'] = False
+    if not PROFILING['color_output']:
+        disable_color()
+    WORK_QUEUE.update({
+        'lease_timeout_seconds': args.lease_timeout,
+        'heartbeat_seconds': args.heartbeat,
+        'poll_seconds': args.poll
+    })
+    
+    if args.workers > 1:
+        run_local_workers(args.movie_folder, args.output_folder, args.workers)
+    else:
+        run_worker(args.movie_folder, args.output_folder)
\ No newline at end of file